@@ -0,0 +1,46 @@
+"""Add pressure, sunshine, radiation and gust tables
+
+Revision ID: 2c6f0b8e4d17
+Revises: 7a8d3c2e1f95
+Create Date: 2026-10-18 19:02:41.315620
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "2c6f0b8e4d17"
+down_revision = "7a8d3c2e1f95"
+branch_labels = None
+depends_on = None
+
+TABLES = [
+    "pressure_measurement",
+    "sunshine_measurement",
+    "radiation_measurement",
+    "gust_measurement",
+]
+
+
+def upgrade():
+    # earlier versions created these tables on startup
+    existing = sa.inspect(op.get_bind()).get_table_names()
+    for name in TABLES:
+        if name in existing:
+            continue
+        op.create_table(
+            name,
+            sa.Column("station_id", sa.Integer(), nullable=False),
+            sa.Column("timestamp", sa.Integer(), nullable=False),
+            sa.Column("value", sa.Float(), nullable=True),
+            sa.ForeignKeyConstraint(
+                ["station_id"],
+                ["station.id"],
+            ),
+            sa.PrimaryKeyConstraint("station_id", "timestamp"),
+        )
+
+
+def downgrade():
+    for name in reversed(TABLES):
+        op.drop_table(name)
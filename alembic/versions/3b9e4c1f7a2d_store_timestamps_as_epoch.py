@@ -0,0 +1,45 @@
+"""Store measurement timestamps as epoch seconds
+
+Revision ID: 3b9e4c1f7a2d
+Revises: 828d2ea066a8
+Create Date: 2026-10-18 09:12:31.402113
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "3b9e4c1f7a2d"
+down_revision = "828d2ea066a8"
+branch_labels = None
+depends_on = None
+
+MEASUREMENT_TABLES = [
+    "temperature_measurement",
+    "humidity_measurement",
+    "precipitation_measurement",
+    "wind_measurement",
+]
+
+
+def upgrade():
+    # Older rows were written as "YYYY-MM-DD HH:MM:SS" strings (UTC) by SQLite's
+    # datetime adapter; only SQLite could have stored them in an INTEGER column.
+    if op.get_bind().dialect.name != "sqlite":
+        return
+    for table in MEASUREMENT_TABLES:
+        op.execute(
+            f"UPDATE OR IGNORE {table} "
+            f"SET timestamp = CAST(strftime('%s', timestamp) AS INTEGER) "
+            f"WHERE typeof(timestamp) = 'text'"
+        )
+        op.execute(f"DELETE FROM {table} WHERE typeof(timestamp) = 'text'")
+
+
+def downgrade():
+    if op.get_bind().dialect.name != "sqlite":
+        return
+    for table in MEASUREMENT_TABLES:
+        op.execute(
+            f"UPDATE {table} SET timestamp = datetime(timestamp, 'unixepoch') "
+            f"WHERE typeof(timestamp) = 'integer'"
+        )
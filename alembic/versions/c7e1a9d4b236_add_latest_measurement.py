@@ -0,0 +1,49 @@
+"""Add latest measurement
+
+Revision ID: c7e1a9d4b236
+Revises: 5d2f8b7c3e10
+Create Date: 2026-10-18 15:21:09.113846
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "c7e1a9d4b236"
+down_revision = "5d2f8b7c3e10"
+branch_labels = None
+depends_on = None
+
+MEASUREMENT_TABLES = {
+    "temperature": "temperature_measurement",
+    "humidity": "humidity_measurement",
+    "precipitation": "precipitation_measurement",
+    "wind": "wind_measurement",
+}
+
+
+def upgrade():
+    op.create_table(
+        "latest_measurement",
+        sa.Column("station_id", sa.Integer(), nullable=False),
+        sa.Column("variable", sa.String(), nullable=False),
+        sa.Column("timestamp", sa.Integer(), nullable=True),
+        sa.Column("value", sa.Float(), nullable=True),
+        sa.ForeignKeyConstraint(
+            ["station_id"],
+            ["station.id"],
+        ),
+        sa.PrimaryKeyConstraint("station_id", "variable"),
+    )
+    for variable, table in MEASUREMENT_TABLES.items():
+        op.execute(
+            f"INSERT INTO latest_measurement (station_id, variable, timestamp, value) "
+            f"SELECT m.station_id, '{variable}', m.timestamp, m.value FROM {table} m "
+            f"JOIN (SELECT station_id, MAX(timestamp) AS timestamp FROM {table} "
+            f"GROUP BY station_id) l "
+            f"ON m.station_id = l.station_id AND m.timestamp = l.timestamp"
+        )
+
+
+def downgrade():
+    op.drop_table("latest_measurement")
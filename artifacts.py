@@ -0,0 +1,49 @@
+import glob
+import hashlib
+import json
+import os
+from typing import Callable
+
+import pandas
+
+from files import write_atomically
+
+CACHE_DIR = ".derived"
+# bump whenever a cached stage computes something different
+VERSION = 1
+
+
+def fingerprint(*parts) -> str:
+    return hashlib.sha256(
+        json.dumps([VERSION, *parts], sort_keys=True, default=str).encode()
+    ).hexdigest()
+
+
+def file_fingerprint(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def artifact_path(name: str, key: str, directory: str = CACHE_DIR) -> str:
+    return os.path.join(directory, f"{name}.{key[:16]}.parquet")
+
+
+def cached(
+    name: str,
+    key: str,
+    compute: Callable[[], pandas.DataFrame],
+    directory: str = CACHE_DIR,
+) -> pandas.DataFrame:
+    path = artifact_path(name, key, directory)
+    if os.path.exists(path):
+        return pandas.read_parquet(path)
+    a = compute()
+    os.makedirs(directory, exist_ok=True)
+    write_atomically(path, a.to_parquet)
+    for x in glob.glob(os.path.join(directory, f"{name}.*.parquet")):
+        if x != path:
+            os.remove(x)
+    return a
@@ -0,0 +1,77 @@
+import asyncio
+import logging
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import aiohttp
+import sqlalchemy
+from sqlalchemy.orm import sessionmaker
+
+import main
+
+SLOT = 10 * 60
+PUBLICATION_DELAY = 2 * 60
+JITTER = 30
+
+
+def seconds_until_next_slot(now: float) -> float:
+    published = now - PUBLICATION_DELAY
+    target = published - published % SLOT + SLOT + PUBLICATION_DELAY
+    return target - now + random.uniform(0, JITTER)
+
+
+def load_states(Session) -> dict:
+    session = Session()
+    try:
+        return main.load_fetch_states(session)
+    finally:
+        session.close()
+
+
+def ingest(Session, responses) -> bool:
+    session = Session()
+    try:
+        main.ingest(responses, session)
+        return True
+    except Exception:
+        logging.exception("Ingestion failed")
+        session.rollback()
+        return False
+    finally:
+        session.close()
+
+
+async def collect(urls, Session, executor: ThreadPoolExecutor):
+    loop = asyncio.get_running_loop()
+    states = await loop.run_in_executor(executor, load_states, Session)
+
+    def remember(responses, future):
+        if future.result():
+            states.update(
+                {x[0]: x[3] for x in responses if x[1] in ("OK", "UNCHANGED")}
+            )
+
+    semaphore = asyncio.Semaphore(main.MAX_CONCURRENT_FETCHES)
+    async with aiohttp.ClientSession() as http:
+        while True:
+            responses = await asyncio.gather(
+                *[main.fetch(x, http, states.get(x), semaphore) for x in urls]
+            )
+            # a single writer thread keeps DB writes in order without holding
+            # up the next fetch
+            future = loop.run_in_executor(executor, ingest, Session, responses)
+            future.add_done_callback(lambda x, r=responses: remember(r, x))
+            await asyncio.sleep(seconds_until_next_slot(time.time()))
+
+
+def run_collector(urls=main.URLS):
+    main.configure_logging()
+    engine = sqlalchemy.create_engine(main.get_db_uri(), pool_pre_ping=True)
+    Session = sessionmaker(bind=engine)
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        asyncio.run(collect(urls, Session, executor))
+
+
+if __name__ == "__main__":
+    run_collector()
@@ -0,0 +1,51 @@
+import numpy
+import pandas
+
+MAGNUS_A = 17.62
+MAGNUS_B = 243.12
+
+
+def crude_dew_point(temperature, humidity):
+    return temperature - (100 - humidity) / 5
+
+
+def magnus_dew_point(temperature, humidity):
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        gamma = numpy.log(humidity / 100) + MAGNUS_A * temperature / (
+            MAGNUS_B + temperature
+        )
+        return MAGNUS_B * gamma / (MAGNUS_A - gamma)
+
+
+def absolute_humidity(temperature, humidity):
+    saturation = 6.112 * numpy.exp(17.67 * temperature / (temperature + 243.5))
+    return saturation * humidity * 2.1674 / (273.15 + temperature)
+
+
+def heat_index(temperature, humidity):
+    t = temperature * 9 / 5 + 32
+    simple = 0.5 * (t + 61 + (t - 68) * 1.2 + humidity * 0.094)
+    rothfusz = (
+        -42.379
+        + 2.04901523 * t
+        + 10.14333127 * humidity
+        - 0.22475541 * t * humidity
+        - 6.83783e-3 * t**2
+        - 5.481717e-2 * humidity**2
+        + 1.22874e-3 * t**2 * humidity
+        + 8.5282e-4 * t * humidity**2
+        - 1.99e-6 * t**2 * humidity**2
+    )
+    res = numpy.where((simple + t) / 2 < 80, simple, rothfusz)
+    return (res - 32) * 5 / 9
+
+
+DEW_POINT_FORMULAS = {"crude": crude_dew_point, "magnus": magnus_dew_point}
+
+
+def add_dew_point(
+    a: pandas.DataFrame, formula: str = "crude", colname: str = "dew_point"
+) -> None:
+    a[colname] = DEW_POINT_FORMULAS[formula](
+        a["temperature"].to_numpy(), a["humidity"].to_numpy()
+    )
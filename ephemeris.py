@@ -0,0 +1,86 @@
+import datetime
+import os.path
+
+import numpy
+import pandas
+from skyfield import almanac, api
+
+EPHEMERIS_PATH = "sun_times_{latitude}_{longitude}.csv"
+EPH = api.load("de421.bsp")
+TIMESCALE = api.load.timescale()
+MORNING = "morning"
+AFTERNOON = "afternoon"
+NIGHT = "night"
+
+
+def compute_sun_table(
+    start: datetime.date, end: datetime.date, latitude: float, longitude: float, tz
+) -> pandas.DataFrame:
+    town = api.wgs84.latlon(latitude, longitude)
+    t0 = TIMESCALE.from_datetime(
+        tz.localize(datetime.datetime.combine(start, datetime.time()))
+    )
+    t1 = TIMESCALE.from_datetime(
+        tz.localize(datetime.datetime.combine(end, datetime.time()))
+        + datetime.timedelta(days=1)
+    )
+    times, events = almanac.find_discrete(t0, t1, almanac.sunrise_sunset(EPH, town))
+    a = pandas.DataFrame(
+        {"time": pandas.to_datetime(times.utc_datetime(), utc=True), "event": events}
+    )
+    a["date"] = a["time"].dt.tz_convert(tz).dt.tz_localize(None).dt.normalize()
+    b = a.groupby(["date", "event"])["time"].first().unstack("event")
+    return b.rename(columns={1: "sunrise", 0: "sunset"})[["sunrise", "sunset"]]
+
+
+def read_sun_table(path: str) -> pandas.DataFrame:
+    a = pandas.read_csv(path, index_col="date", parse_dates=["date"])
+    for x in ["sunrise", "sunset"]:
+        a[x] = pandas.to_datetime(a[x], utc=True)
+    return a
+
+
+def load_sun_table(
+    start: datetime.date,
+    end: datetime.date,
+    latitude: float,
+    longitude: float,
+    tz,
+    path: str = EPHEMERIS_PATH,
+) -> pandas.DataFrame:
+    path = path.format(latitude=latitude, longitude=longitude)
+    table = read_sun_table(path) if os.path.exists(path) else pandas.DataFrame()
+    days = pandas.date_range(start, end, freq="D")
+    missing = days[~days.isin(table.index)]
+    if len(missing) > 0:
+        fresh = compute_sun_table(
+            missing.min().date(), missing.max().date(), latitude, longitude, tz
+        )
+        table = pandas.concat([table[~table.index.isin(fresh.index)], fresh])
+        table.sort_index().to_csv(path, index_label="date")
+    return table.loc[table.index.isin(days)]
+
+
+def classify_daytime(
+    timestamps: pandas.Series, latitude: float, longitude: float, tz
+) -> pandas.Series:
+    if timestamps.empty:
+        return pandas.Series(index=timestamps.index, dtype=object, name="daytime")
+    days = timestamps.dt.normalize()
+    table = load_sun_table(days.min(), days.max(), latitude, longitude, tz)
+    sunrise = days.map(table["sunrise"])
+    sunset = days.map(table["sunset"])
+    noon = sunrise + (sunset - sunrise) / 2
+    localized = timestamps.dt.tz_localize(
+        tz, ambiguous=numpy.zeros(len(timestamps), dtype=bool), nonexistent="NaT"
+    )
+    res = numpy.select(
+        [
+            (localized < sunrise) | (localized > sunset),
+            (sunrise < localized) & (localized < noon),
+            (noon < localized) & (localized < sunset),
+        ],
+        [NIGHT, MORNING, AFTERNOON],
+        default=None,
+    )
+    return pandas.Series(res, index=timestamps.index, name="daytime")
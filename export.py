@@ -0,0 +1,163 @@
+import datetime
+import logging
+import os
+from typing import List, Optional
+
+import pandas
+import pyarrow
+import pyarrow.dataset
+import pyarrow.parquet
+import sqlalchemy
+
+import loader
+import models
+import partitions
+from main import FEEDS
+from files import write_atomically
+
+EXPORT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "parquet")
+# late rows of a month are still ingested for a while after it ended
+EXPORT_GRACE = datetime.timedelta(days=1)
+EXPORTED_AT = b"meteogetter.exported_at"
+PARTITIONING = pyarrow.dataset.partitioning(
+    pyarrow.schema(
+        [
+            ("year", pyarrow.int16()),
+            ("month", pyarrow.int8()),
+        ]
+    ),
+    flavor="hive",
+)
+
+
+def partition_path(
+    variable: str, month: pandas.Period, directory: str = EXPORT_DIR
+) -> str:
+    return os.path.join(
+        directory,
+        f"variable={variable}",
+        f"year={month.year}",
+        f"month={month.month:02d}",
+        "part.parquet",
+    )
+
+
+def data_months(session, variable: str) -> List[pandas.Period]:
+    table, _ = loader.variable_table(variable)
+    months = set(partitions.months_with_rows(session, table))
+    for month in partitions.archived_months():
+        path = partitions.archive_path(month)
+        with partitions.archive_engine(path).connect() as archive:
+            if not sqlalchemy.inspect(archive).has_table(table.name):
+                continue
+            query = sqlalchemy.select(table.c.timestamp).limit(1)
+            if archive.execute(query).first() is not None:
+                months.add(month)
+    return sorted(months)
+
+
+def export_month(
+    session, variable: str, month: pandas.Period, directory: str = EXPORT_DIR
+) -> bool:
+    a = loader.load_measurements(
+        session.connection(),
+        variable,
+        start=month.start_time.to_pydatetime(),
+        end=(month + 1).start_time.to_pydatetime(),
+    )
+    if a.empty:
+        return False
+    path = partition_path(variable, month, directory)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    table = pyarrow.Table.from_pandas(a, preserve_index=False)
+    exported_at = str(models.to_epoch(datetime.datetime.utcnow())).encode()
+    table = table.replace_schema_metadata(
+        {**table.schema.metadata, EXPORTED_AT: exported_at}
+    )
+    write_atomically(
+        path, lambda x: pyarrow.parquet.write_table(table, x, compression="zstd")
+    )
+    return True
+
+
+def is_complete(path: str, month: pandas.Period) -> bool:
+    # a partition is final once it was written after its month (plus grace)
+    # had ended; anything exported earlier may be missing rows
+    if not os.path.exists(path):
+        return False
+    metadata = pyarrow.parquet.read_schema(path).metadata or {}
+    if EXPORTED_AT not in metadata:
+        return False
+    _, end = partitions.month_bounds(month)
+    grace = EXPORT_GRACE.total_seconds()
+    return int(metadata[EXPORTED_AT]) >= end + grace
+
+
+def export(session, variables: List[str] = None, directory: str = EXPORT_DIR) -> None:
+    for variable in variables or [x.name for x in FEEDS]:
+        # only months holding rows, so empty ones are not queried every run
+        for month in data_months(session, variable):
+            path = partition_path(variable, month, directory)
+            if is_complete(path, month):
+                continue
+            if export_month(session, variable, month, directory):
+                logging.info(f"Exported {variable} {month}")
+
+
+def month_filter(start: datetime.datetime, end: datetime.datetime):
+    year = pyarrow.dataset.field("year")
+    month = pyarrow.dataset.field("month")
+    expression = None
+    if start is not None:
+        expression = (year > start.year) | (
+            (year == start.year) & (month >= start.month)
+        )
+    if end is not None:
+        last = end - datetime.timedelta(microseconds=1)
+        before = (year < last.year) | ((year == last.year) & (month <= last.month))
+        expression = before if expression is None else expression & before
+    return expression
+
+
+def read_measurements(
+    variable: str,
+    columns: List[str] = None,
+    station_id: Optional[int] = None,
+    start: Optional[datetime.datetime] = None,
+    end: Optional[datetime.datetime] = None,
+    directory: str = EXPORT_DIR,
+) -> pandas.DataFrame:
+    dataset = pyarrow.dataset.dataset(
+        os.path.join(directory, f"variable={variable}"),
+        format="parquet",
+        partitioning=PARTITIONING,
+    )
+    timestamp = pyarrow.dataset.field("timestamp")
+    expression = month_filter(start, end)
+    if expression is None:
+        expression = pyarrow.dataset.scalar(True)
+    if station_id is not None:
+        expression &= pyarrow.dataset.field("station_id") == station_id
+    if start is not None:
+        expression &= timestamp >= pandas.Timestamp(start)
+    if end is not None:
+        expression &= timestamp < pandas.Timestamp(end)
+    if columns is None:
+        columns = [
+            x for x in dataset.schema.names if x not in PARTITIONING.schema.names
+        ]
+    return dataset.to_table(columns=columns, filter=expression).to_pandas()
+
+
+def run_export():
+    from sqlalchemy.orm import sessionmaker
+
+    from main import configure_logging, get_db_uri
+
+    configure_logging()
+    engine = sqlalchemy.create_engine(get_db_uri())
+    export(sessionmaker(bind=engine)())
+
+
+if __name__ == "__main__":
+    run_export()
@@ -0,0 +1,44 @@
+import os
+from typing import List
+
+import sqlalchemy
+import yaml
+from sqlalchemy import Column, Float, ForeignKey, Integer
+
+import models
+from mytypes import Feed, FeedColumn
+
+FEEDS_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "conf", "feeds.yaml"
+)
+
+
+def load_feeds(path: str = FEEDS_PATH) -> List[Feed]:
+    with open(path) as f:
+        config = yaml.safe_load(f)
+    return [
+        Feed(
+            name=x["name"],
+            url=x["url"],
+            table=x["table"],
+            columns=tuple(FeedColumn(**y) for y in x["columns"]),
+        )
+        for x in config["feeds"]
+    ]
+
+
+def feed_table(feed: Feed) -> sqlalchemy.Table:
+    tables = models.Base.metadata.tables
+    if feed.table in tables:
+        table = tables[feed.table]
+        missing = [x.target for x in feed.columns if x.target not in table.c]
+        if missing:
+            raise ValueError(f"Table {feed.table} has no columns {missing}")
+        return table
+    return sqlalchemy.Table(
+        feed.table,
+        models.Base.metadata,
+        Column("station_id", Integer, ForeignKey("station.id"), primary_key=True),
+        Column("timestamp", Integer, primary_key=True),
+        *[Column(x.target, Float) for x in feed.columns],
+    )
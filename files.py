@@ -0,0 +1,16 @@
+import os
+import tempfile
+
+
+def write_atomically(path: str, write) -> None:
+    fd, tmp = tempfile.mkstemp(
+        dir=os.path.dirname(path) or ".", suffix=os.path.splitext(path)[1]
+    )
+    os.close(fd)
+    try:
+        write(tmp)
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, path)
+    except Exception:
+        os.remove(tmp)
+        raise
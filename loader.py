@@ -0,0 +1,103 @@
+import datetime
+from typing import Optional
+
+import pandas
+import sqlalchemy
+
+import feeds
+import models
+import partitions
+from main import FEEDS
+
+VARIABLES = {
+    "temperature": (models.TemperatureMeasurement, {"value": "temperature"}),
+    "humidity": (models.HumidityMeasurement, {"value": "humidity"}),
+    "precipitation": (models.PrecipitationMeasurement, {"value": "precipitation"}),
+    "wind": (
+        models.WindMeasurement,
+        {"value": "windspeed", "direction": "winddirection"},
+    ),
+}
+
+
+def variable_table(variable: str) -> (sqlalchemy.Table, dict):
+    if variable in VARIABLES:
+        model, columns = VARIABLES[variable]
+        return model.__table__, columns
+    feed = {x.name: x for x in FEEDS}[variable]
+    return feeds.feed_table(feed), {
+        x.target: variable if x.target == "value" else f"{variable}_{x.target}"
+        for x in feed.columns
+    }
+
+
+def build_query(
+    variable: str,
+    station_id: Optional[int] = None,
+    start: Optional[datetime.datetime] = None,
+    end: Optional[datetime.datetime] = None,
+) -> sqlalchemy.sql.Select:
+    table, columns = variable_table(variable)
+    query = sqlalchemy.select(
+        table.c.station_id,
+        table.c.timestamp,
+        *[table.c[k].label(v) for k, v in columns.items()],
+    )
+    if station_id is not None:
+        query = query.where(table.c.station_id == station_id)
+    if start is not None:
+        query = query.where(table.c.timestamp >= models.to_epoch(start))
+    if end is not None:
+        query = query.where(table.c.timestamp < models.to_epoch(end))
+    return query.order_by(table.c.station_id, table.c.timestamp)
+
+
+def load_measurements(
+    connection,
+    variable: str,
+    station_id: Optional[int] = None,
+    start: Optional[datetime.datetime] = None,
+    end: Optional[datetime.datetime] = None,
+) -> pandas.DataFrame:
+    table, columns = variable_table(variable)
+    dtypes = {"station_id": "int64", "timestamp": "int64"}
+    dtypes.update({x: "float64" for x in columns.values()})
+    query = build_query(variable, station_id, start, end)
+    frames = []
+    for path in partitions.route(
+        models.to_epoch(start) if start is not None else None,
+        models.to_epoch(end) if end is not None else None,
+    ):
+        with partitions.archive_engine(path).connect() as archive:
+            # feeds enabled after a month was archived have no table there
+            if sqlalchemy.inspect(archive).has_table(table.name):
+                frames.append(pandas.read_sql_query(query, archive, dtype=dtypes))
+    frames.append(pandas.read_sql_query(query, connection, dtype=dtypes))
+    a = pandas.concat(frames, ignore_index=True)
+    if len(frames) > 1:
+        a = a.sort_values(["station_id", "timestamp"], ignore_index=True)
+    a["timestamp"] = models.series_from_epoch(a["timestamp"])
+    return a
+
+
+def load_rollups(
+    connection,
+    variable: str,
+    daily: bool = True,
+    station_id: Optional[int] = None,
+    start: Optional[datetime.datetime] = None,
+    end: Optional[datetime.datetime] = None,
+) -> pandas.DataFrame:
+    table = (models.DailyRollup if daily else models.HourlyRollup).__table__
+    query = sqlalchemy.select(table).where(table.c.variable == variable)
+    if station_id is not None:
+        query = query.where(table.c.station_id == station_id)
+    if start is not None:
+        query = query.where(table.c.timestamp >= models.to_epoch(start))
+    if end is not None:
+        query = query.where(table.c.timestamp < models.to_epoch(end))
+    a = pandas.read_sql_query(
+        query.order_by(table.c.station_id, table.c.timestamp), connection
+    )
+    a["timestamp"] = models.series_from_epoch(a["timestamp"])
+    return a
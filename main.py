@@ -1,71 +1,156 @@
 import asyncio
+import hashlib
 import io
 import logging
 import os
+import random
 from sqlite3 import Cursor
+from typing import Tuple
 
 import aiohttp
-import dateutil
 import pandas
 import sqlalchemy
-from returns.result import Result, safe
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.orm import sessionmaker
 
+import feeds
 import models
+import rollups
+import stations
+from mytypes import Feed
 
 NAPTIME = 60 * 60
 
-url_temp = "https://data.geo.admin.ch/ch.meteoschweiz.messwerte-lufttemperatur-10min/ch.meteoschweiz.messwerte-lufttemperatur-10min_en.csv"
-url_humidity = "https://data.geo.admin.ch/ch.meteoschweiz.messwerte-luftfeuchtigkeit-10min/ch.meteoschweiz.messwerte-luftfeuchtigkeit-10min_en.csv"
-url_wind = "https://data.geo.admin.ch/ch.meteoschweiz.messwerte-windgeschwindigkeit-kmh-10min/ch.meteoschweiz.messwerte-windgeschwindigkeit-kmh-10min_en.csv"
-url_precipitation = "https://data.geo.admin.ch/ch.meteoschweiz.messwerte-niederschlag-10min/ch.meteoschweiz.messwerte-niederschlag-10min_en.csv"
-
-
-def parse_to_dataframe(b):
-
-    c = b[2]
-    d = c.decode("latin-1")
-    e = d.split("\n")
-    f = "\n".join(e[:-5])
-    g = pandas.read_csv(io.StringIO(f), skiprows=0, sep=";")
-    return g
-
-
-def read_respone(x: asyncio.Task):
-    a = x.result()
-    res = [parse_to_dataframe(x) for x in a]
-    return res
+FEEDS = feeds.load_feeds()
+URLS = [x.url for x in FEEDS]
+FETCH_ATTEMPTS = 4
+BACKOFF_BASE = 2
+MAX_CONCURRENT_FETCHES = 4
+STATIONS = stations.StationRegistry()
+
+FOOTER_LINES = 5
+CSV_DTYPES = {
+    "Station": str,
+    "Abbr.": str,
+    "WIGOS-ID": str,
+    "Measurement date": str,
+    "More information m a. ground": str,
+}
+STATION_NUMBERS = [
+    "Latitude",
+    "Longitude",
+    "Measurement height m a. sea level",
+]
+
+
+def parse_to_dataframe(b, feed: Feed = None):
+    content = b[2]
+    # numbers are read as text and coerced, so one malformed cell turns into
+    # a missing value instead of failing the whole payload
+    dtypes = dict(CSV_DTYPES)
+    dtypes.update({x: str for x in STATION_NUMBERS})
+    if feed is not None:
+        dtypes.update({x.source: str for x in feed.columns})
+    # the feeds end with a few lines of notes; cut them off by byte offset
+    # instead of splitting and re-joining every line of the payload
+    body = content.rsplit(b"\n", FOOTER_LINES)[0]
+    a = pandas.read_csv(
+        io.BytesIO(body),
+        sep=";",
+        encoding="latin-1",
+        dtype=dtypes,
+        na_values=["-"],
+    )
+    for x in STATION_NUMBERS:
+        if x in a.columns:
+            a[x] = pandas.to_numeric(a[x], errors="coerce")
+    return a
 
 
-async def fetch(url, session):
+async def fetch_once(url, session, state: dict):
     headers = {
         "User-Agent": "Mozilla/5.0 (Windows NT 6.3; Win64; x64; rv:64.0) Gecko/20100101 Firefox/64.0"
     }
-    try:
-        async with session.get(
-            url,
-            headers=headers,
-            ssl=False,
-            timeout=aiohttp.ClientTimeout(total=None, sock_connect=10, sock_read=10),
-        ) as response:
-            content = await response.read()
-            return (url, "OK", content)
-    except Exception as e:
-        print(e)
-        return (url, "ERROR", str(e))
-
-
-async def run(url_list):
+    if state.get("etag"):
+        headers["If-None-Match"] = state["etag"]
+    if state.get("last_modified"):
+        headers["If-Modified-Since"] = state["last_modified"]
+    async with session.get(
+        url,
+        headers=headers,
+        ssl=False,
+        timeout=aiohttp.ClientTimeout(total=None, sock_connect=10, sock_read=10),
+    ) as response:
+        if response.status == 304:
+            # a 304 may still carry refreshed validators
+            new_state = {
+                **state,
+                "etag": response.headers.get("ETag") or state.get("etag"),
+                "last_modified": response.headers.get("Last-Modified")
+                or state.get("last_modified"),
+            }
+            return (url, "NOT_MODIFIED", None, new_state)
+        response.raise_for_status()
+        content = await response.read()
+        new_state = {
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "content_hash": hashlib.sha256(content).hexdigest(),
+        }
+        if new_state["content_hash"] == state.get("content_hash"):
+            return (url, "UNCHANGED", None, new_state)
+        return (url, "OK", content, new_state)
+
+
+async def fetch(url, session, state: dict = None, semaphore: asyncio.Semaphore = None):
+    state = state or {}
+    semaphore = semaphore or asyncio.Semaphore(1)
+    for attempt in range(FETCH_ATTEMPTS):
+        try:
+            async with semaphore:
+                return await fetch_once(url, session, state)
+        except Exception as e:
+            logging.warning(f"Fetching {url} failed (attempt {attempt + 1}): {e}")
+            error = e
+        if attempt + 1 < FETCH_ATTEMPTS:
+            delay = BACKOFF_BASE * 2**attempt
+            await asyncio.sleep(delay + random.uniform(0, delay))
+    return (url, "ERROR", str(error), state)
+
+
+async def run(url_list, states: dict = None):
+    states = states or {}
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_FETCHES)
     tasks = []
     async with aiohttp.ClientSession() as session:
         for url in url_list:
-            task = asyncio.ensure_future(fetch(url, session))
+            task = asyncio.ensure_future(
+                fetch(url, session, states.get(url), semaphore)
+            )
             tasks.append(task)
         responses = asyncio.gather(*tasks)
         await responses
     return responses
 
 
+def load_fetch_states(session) -> dict:
+    return {
+        x.url: {
+            "etag": x.etag,
+            "last_modified": x.last_modified,
+            "content_hash": x.content_hash,
+        }
+        for x in session.query(models.FetchState).all()
+    }
+
+
+def save_fetch_states(responses, session) -> None:
+    for url, status, _, state in responses:
+        if status in ("OK", "UNCHANGED", "NOT_MODIFIED"):
+            session.merge(models.FetchState(url=url, **state))
+    session.commit()
+
+
 def write_stations(a: [pandas.DataFrame], cur: Cursor) -> dict:
     asdf = cur.execute("SELECT * FROM station").fetchall()
     dict = {}
@@ -98,118 +183,167 @@ def test_read():
         return [a, b]
 
 
-def data_row_to_station(a):
-    x = None
-    try:
-        b = a[1]
-        x = models.Station(
-            name=b["Station"],
-            abbr=b["Abbr."],
-            latitude=b["Latitude"],
-            longitude=b["Longitude"],
-            altitude=b["Measurement height m a. sea level"],
-            height=b["More information m a. ground"],
-        )
-        return x
-    except Exception as e:
-        return None
+def handle_stations(a: [(Feed, pandas.DataFrame)], session) -> dict:
+    primary = [x for feed, x in a if feed == FEEDS[0]]
+    return STATIONS.sync([x for _, x in a], session, primary[0] if primary else None)
 
 
-def handle_stations(a, session) -> dict:
-    known_stations = session.query(models.Station).all()
-    stations = [data_row_to_station(x) for x in a[0].iterrows()]
-    known_abbrs = [x.abbr for x in known_stations]
-    new_stations = [x for x in stations if x.abbr not in known_abbrs]
-    session.add_all(new_stations)
-    session.commit()
-    stations: [models.Station] = session.query(models.Station).all()
+MEASUREMENT_DATE = "Measurement date"
+ABBR = "Abbr."
+
 
-    return {x.abbr: x.id for x in stations}
+def to_measurement_frame(
+    a: pandas.DataFrame, station_ids: dict, feed: Feed
+) -> Tuple[pandas.DataFrame, pandas.DataFrame]:
+    b = pandas.DataFrame(
+        {
+            "station_id": a[ABBR].map(station_ids),
+            "timestamp": pandas.to_datetime(a[MEASUREMENT_DATE], errors="coerce"),
+        }
+    )
+    for column in feed.columns:
+        b[column.target] = (
+            pandas.to_numeric(a[column.source], errors="coerce") * column.scale
+            + column.offset
+        )
+    broken = b["station_id"].isna() | b["timestamp"].isna()
+    good = b[~broken].astype({"station_id": "int64"})
+    good["timestamp"] = models.series_to_epoch(good["timestamp"])
+    return good, a[broken]
 
 
-@safe
-def handle_humidity_row(a, station_ids: dict) -> Result:
-    b = a[1]
-    id = station_ids[b["Abbr."]]
-    timestamp = dateutil.parser.parse(b["Measurement date"])
-    val = b["Humidity %"]
+def to_records(a: pandas.DataFrame) -> [dict]:
+    return a.astype(object).where(a.notna(), None).to_dict("records")
 
-    return models.HumidityMeasurement(station_id=id, timestamp=timestamp, value=val)
 
+def insert_ignoring_duplicates(session, table: sqlalchemy.Table):
+    dialect = session.get_bind().dialect.name
+    if dialect == "sqlite":
+        return sqlite.insert(table).on_conflict_do_nothing()
+    if dialect == "postgresql":
+        return postgresql.insert(table).on_conflict_do_nothing()
+    return table.insert()
 
-@safe
-def handle_precipitation_row(a, station_ids: dict) -> Result:
-    b = a[1]
-    id = station_ids[b["Abbr."]]
-    timestamp = dateutil.parser.parse(b["Measurement date"])
-    val = b["Precipitation mm"]
 
-    return models.PrecipitationMeasurement(
-        station_id=id, timestamp=timestamp, value=val
+def latest_timestamps(session, variable: str) -> pandas.Series:
+    table = models.LatestMeasurement.__table__
+    rows = session.execute(
+        sqlalchemy.select(table.c.station_id, table.c.timestamp).where(
+            table.c.variable == variable
+        )
+    ).all()
+    return pandas.Series(
+        [x[1] for x in rows], index=[x[0] for x in rows], dtype="float64"
     )
 
 
-@safe
-def handle_temp_row(a, station_ids: dict) -> Result:
-    b = a[1]
-    id = station_ids[b["Abbr."]]
-    timestamp = dateutil.parser.parse(b["Measurement date"])
-    val = b["Temperature °C"]
-    return models.TemperatureMeasurement(station_id=id, timestamp=timestamp, value=val)
-
-
-@safe
-def handle_wind_row(a, station_ids: dict) -> Result:
-    b = a[1]
-    id = station_ids[b["Abbr."]]
-    timestamp = dateutil.parser.parse(b["Measurement date"])
-    val = b["Wind km/h"]
-    direction = b["Wind direction °"]
-    return models.WindMeasurement(
-        station_id=id, timestamp=timestamp, value=val, direction=direction
+def update_latest(session, feed: Feed, a: pandas.DataFrame) -> None:
+    b = a.sort_values("timestamp").drop_duplicates("station_id", keep="last")
+    records = [
+        {
+            "station_id": x["station_id"],
+            "variable": feed.name,
+            "timestamp": x["timestamp"],
+            "value": x[feed.columns[0].target],
+        }
+        for x in to_records(b)
+    ]
+    table = models.LatestMeasurement.__table__
+    dialect = session.get_bind().dialect.name
+    if dialect not in ("sqlite", "postgresql"):
+        for x in records:
+            session.merge(models.LatestMeasurement(**x))
+        return
+    insert = (sqlite if dialect == "sqlite" else postgresql).insert(table)
+    session.execute(
+        insert.on_conflict_do_update(
+            index_elements=[table.c.station_id, table.c.variable],
+            set_={
+                "timestamp": insert.excluded.timestamp,
+                "value": insert.excluded.value,
+            },
+            where=insert.excluded.timestamp > table.c.timestamp,
+        ),
+        records,
     )
 
 
-def get_handler(a: pandas.DataFrame):
-    if any("Temperature" in x for x in a.columns):
-        return handle_temp_row
-    if any("Humidity" in x for x in a.columns):
-        return handle_humidity_row
-    if any("Wind km/h" in x for x in a.columns):
-        return handle_wind_row
-    if any("Precipitation mm" in x for x in a.columns):
-        return handle_precipitation_row
+def drop_known_measurements(
+    a: pandas.DataFrame, latest: pandas.Series
+) -> pandas.DataFrame:
+    cutoff = a["station_id"].map(latest)
+    return a[cutoff.isna() | (a["timestamp"] > cutoff)]
 
 
-def handle_measurements(a: [pandas.DataFrame], station_ids: dict, session):
-    vals = []
+def handle_measurements(a: [Tuple[Feed, pandas.DataFrame]], station_ids: dict, session):
     bwoken = []
-    for asdf in a:
-        handler = get_handler(asdf)
-        b = [(handler(x, station_ids), x) for x in asdf.iterrows()]
-        vals = vals + [x.value_or(False) for x, _ in b if x.value_or(False)]
-        errors = [y for x, y in b if x.value_or("Error") == "Error"]
-        bwoken = bwoken + errors
-    session.add_all(vals)
+    for feed, asdf in a:
+        missing = [x.source for x in feed.columns if x.source not in asdf.columns]
+        if missing:
+            logging.warning(f"Feed {feed.name} is missing columns {missing}")
+            continue
+        table = feeds.feed_table(feed)
+        good, errors = to_measurement_frame(asdf, station_ids, feed)
+        good = drop_known_measurements(good, latest_timestamps(session, feed.name))
+        if not good.empty:
+            session.execute(
+                insert_ignoring_duplicates(session, table), to_records(good)
+            )
+            update_latest(session, feed, good)
+            rollups.refresh(session, feed, good)
+        bwoken.append(errors)
     session.commit()
+    bwoken = pandas.concat(bwoken) if bwoken else pandas.DataFrame()
+    if not bwoken.empty:
+        logging.warning(f"Skipped {len(bwoken)} malformed rows")
+    return bwoken
+
+
+def ingest(responses, session) -> None:
+    by_url = {x.url: x for x in FEEDS}
+    for url, status, error, _ in responses:
+        if status == "ERROR":
+            logging.warning(f"Skipping {url}: {error}")
+    dataframes = []
+    failed = set()
+    for response in responses:
+        url, status = response[0], response[1]
+        if status != "OK":
+            continue
+        try:
+            dataframes.append((by_url[url], parse_to_dataframe(response, by_url[url])))
+        except Exception as e:
+            logging.warning(f"Skipping {url}: could not parse payload: {e}")
+            failed.add(url)
+    # a payload that failed to parse must be downloaded again next time
+    responses = [x for x in responses if x[0] not in failed]
+    if not dataframes:
+        save_fetch_states(responses, session)
+        logging.info("Nothing new to get")
+        return
+    station_ids = handle_stations(dataframes, session)
+    handle_measurements(dataframes, station_ids, session)
+    save_fetch_states(responses, session)
+    logging.info("Successfuly get")
 
 
-def main(name):
-    engine = sqlalchemy.create_engine(get_db_uri())
-    Session = sessionmaker(bind=engine)
-    session = Session()
+def configure_logging():
     logging.basicConfig(
         filename="log.txt",
         format="%(asctime)s %(levelname)-2s %(message)s",
         datefmt="%Y-%m-%d %H:%M:%S",
         level=logging.INFO,
     )
+
+
+def main(name):
+    engine = sqlalchemy.create_engine(get_db_uri())
+    Session = sessionmaker(bind=engine)
+    session = Session()
+    configure_logging()
     # Use a breakpoint in the code line below to debug your script.
-    res = asyncio.run(run([url_temp, url_humidity, url_precipitation, url_wind]))
-    dataframes = read_respone(res)
-    station_ids = handle_stations(dataframes, session)
-    handle_measurements(dataframes, station_ids, session)
-    logging.info("Successfuly get")
+    res = asyncio.run(run(URLS, load_fetch_states(session)))
+    ingest(res.result(), session)
 
 
 # Press the green button in the gutter to run the script.
@@ -1,10 +1,24 @@
 import datetime
 
-import dateutil
+import pandas
 from sqlalchemy.orm import declarative_base
 
 Base = declarative_base()
-from sqlalchemy import Column, Integer, String, Float, ForeignKey, orm, DateTime
+from sqlalchemy import Column, Integer, String, Float, ForeignKey, DateTime, Index
+
+
+def to_epoch(a: datetime.datetime) -> int:
+    if a.tzinfo is None:
+        a = a.replace(tzinfo=datetime.timezone.utc)
+    return int(a.timestamp())
+
+
+def series_to_epoch(a: pandas.Series) -> pandas.Series:
+    return a.astype("int64") // 10**9
+
+
+def series_from_epoch(a: pandas.Series) -> pandas.Series:
+    return pandas.to_datetime(a, unit="s")
 
 
 class Station(Base):
@@ -31,10 +45,6 @@ class TemperatureMeasurement(Base):
     def __repr__(self):
         return f"Station {self.station_id} temp at {self.timestamp}: {self.value}"
 
-    @orm.reconstructor
-    def init_on_load(self):
-        self.timestamp = dateutil.parser.parse(self.timestamp)
-
     def to_dict(self):
         return {
             "temperature": self.value,
@@ -50,10 +60,6 @@ class HumidityMeasurement(Base):
     timestamp = Column(Integer, primary_key=True)
     value = Column(Float)
 
-    @orm.reconstructor
-    def init_on_load(self):
-        self.timestamp = dateutil.parser.parse(self.timestamp)
-
     def __repr__(self):
         return f"Station {self.station_id} humidity at {self.timestamp}: {self.value}"
 
@@ -72,10 +78,6 @@ class PrecipitationMeasurement(Base):
     timestamp = Column(Integer, primary_key=True)
     value = Column(Float)
 
-    @orm.reconstructor
-    def init_on_load(self):
-        self.timestamp = dateutil.parser.parse(self.timestamp)
-
     def __repr__(self):
         return f"Station {self.station_id} preiciptation at {self.timestamp}: {self.value} mm"
 
@@ -95,10 +97,6 @@ class WindMeasurement(Base):
     value = Column(Float)
     direction = Column(Float)
 
-    @orm.reconstructor
-    def init_on_load(self):
-        self.timestamp = dateutil.parser.parse(self.timestamp)
-
     def __repr__(self):
         return f"Station {self.station_id} windspeed, direction at {self.timestamp}: {self.value}, {self.direction}"
 
@@ -113,12 +111,83 @@ class WindMeasurement(Base):
 
 class Notification(Base):
     __tablename__ = "notification"
+    __table_args__ = (Index("ix_notification_key_timestamp", "key", "timestamp"),)
     id = Column(Integer, primary_key=True, autoincrement=True)
     timestamp = Column(DateTime, primary_key=False)
+    key = Column(String, nullable=True)
 
-    def __init__(self, timestamp: datetime.datetime):
+    def __init__(self, timestamp: datetime.datetime, key: str = None):
         self.timestamp = timestamp
+        self.key = key
+
+
+class MonthlyStatistic(Base):
+    __tablename__ = "monthly_statistic"
+
+    source = Column(String, primary_key=True)
+    station_id = Column(Integer, primary_key=True)
+    month = Column(Integer, primary_key=True)
+    variable = Column(String, primary_key=True)
+    mean = Column(Float)
+    low = Column(Float)
+    high = Column(Float)
+    count = Column(Integer)
+
+    def __repr__(self):
+        return f"{self.source} {self.station_id} {self.variable} at {self.month}: {self.mean}"
+
+
+class FetchState(Base):
+    __tablename__ = "fetch_state"
+
+    url = Column(String, primary_key=True)
+    etag = Column(String)
+    last_modified = Column(String)
+    content_hash = Column(String)
+
+    def __repr__(self):
+        return f"Fetch state {self.url}: {self.etag} {self.last_modified}"
 
-    @orm.reconstructor
-    def init_on_load(self):
-        self.timestamp = dateutil.parser.parse(self.timestamp)
+
+class LatestMeasurement(Base):
+    __tablename__ = "latest_measurement"
+
+    station_id = Column(Integer, ForeignKey("station.id"), primary_key=True)
+    variable = Column(String, primary_key=True)
+    timestamp = Column(Integer)
+    value = Column(Float)
+
+    def __repr__(self):
+        return f"Station {self.station_id} latest {self.variable} at {self.timestamp}: {self.value}"
+
+
+class HourlyRollup(Base):
+    __tablename__ = "hourly_rollup"
+
+    station_id = Column(Integer, ForeignKey("station.id"), primary_key=True)
+    variable = Column(String, primary_key=True)
+    timestamp = Column(Integer, primary_key=True)
+    minimum = Column(Float)
+    maximum = Column(Float)
+    mean = Column(Float)
+    count = Column(Integer)
+    total = Column(Float)
+
+    def __repr__(self):
+        return f"Station {self.station_id} hourly {self.variable} at {self.timestamp}: {self.mean}"
+
+
+class DailyRollup(Base):
+    __tablename__ = "daily_rollup"
+
+    station_id = Column(Integer, ForeignKey("station.id"), primary_key=True)
+    variable = Column(String, primary_key=True)
+    timestamp = Column(Integer, primary_key=True)
+    minimum = Column(Float)
+    maximum = Column(Float)
+    mean = Column(Float)
+    count = Column(Integer)
+    total = Column(Float)
+
+    def __repr__(self):
+        return f"Station {self.station_id} daily {self.variable} at {self.timestamp}: {self.mean}"
@@ -1,64 +1,218 @@
-# Import smtplib for the actual sending function
-import smtplib
-from datetime import datetime, timedelta
-from typing import Dict
-
-from origamibot import OrigamiBot as Bot
-
-# Import the email modules we'll need
-from email.message import EmailMessage
+import logging
+import os
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
 
 import sqlalchemy
 import yaml
 from sqlalchemy.orm import sessionmaker, Session
 
+import feeds
 import models
-from main import get_db_uri
+import notify
+from main import FEEDS, get_db_uri
+from mytypes import Rule, Violation
 
+DEFAULT_COOLDOWN = 24 * 60
+DIGEST_THRESHOLD = 3
+DELIVERY_TIMEOUT = 60
+DELIVERY_QUEUE = None
+ERROR_KEY = "error:monitor"
+ERROR_STAMP = ".monitor_error"
 
-def send_notification(content: str, config: Dict, session: Session = None):
-    message = EmailMessage()
-    message.set_content(content)
 
-    bot = Bot(config["token"])
-    bot.send_message(config["chat_id"], content)
+def delivery_queue(config: Dict) -> notify.DeliveryQueue:
+    global DELIVERY_QUEUE
+    if DELIVERY_QUEUE is None:
+        DELIVERY_QUEUE = notify.DeliveryQueue(notify.transport_from_config(config))
+    return DELIVERY_QUEUE
 
-    if session:
-        record = models.Notification(datetime.now())
-        session.add(record)
-        session.commit()
 
-    return
+def close_delivery_queue() -> None:
+    global DELIVERY_QUEUE
+    if DELIVERY_QUEUE is not None:
+        DELIVERY_QUEUE.close(DELIVERY_TIMEOUT)
+        DELIVERY_QUEUE = None
 
 
-def measuremnts_too_old(session: Session, station_id: int):
-    dt = datetime.now()
+def send_notification(
+    content: str, config: Dict, session: Session = None, keys: List[str] = ()
+):
+    on_delivered = None
+    if session:
+        bind = session.get_bind()
+
+        def on_delivered():
+            # only delivered messages count towards the cooldown; this runs on
+            # the delivery thread, which needs a session of its own
+            with Session(bind=bind) as delivered:
+                delivered.add_all(
+                    [models.Notification(datetime.now(), x) for x in keys or [None]]
+                )
+                delivered.commit()
+
+    delivery_queue(config).submit(content, on_delivered)
+
+
+def load_rules(config: Dict) -> List[Rule]:
+    if "rules" not in config:
+        return [
+            Rule(
+                variables=("temperature", "humidity"),
+                stations=(config["station_id"],),
+                max_age=120,
+            )
+        ]
+    return [
+        Rule(
+            variables=tuple(x["variables"]),
+            stations=tuple(x["stations"]) if x.get("stations") != "all" else None,
+            max_age=x.get("max_age"),
+            minimum=x.get("min"),
+            maximum=x.get("max"),
+            flatline=x.get("flatline"),
+        )
+        for x in config["rules"]
+    ]
+
+
+def watched_stations(rules: List[Rule]) -> Optional[set]:
+    if any(x.stations is None for x in rules):
+        return None
+    return {y for x in rules for y in x.stations}
+
+
+def check_latest(session: Session, rules: List[Rule], now: int) -> List[Violation]:
+    table = models.LatestMeasurement.__table__
+    query = sqlalchemy.select(
+        table.c.station_id, table.c.variable, table.c.timestamp, table.c.value
+    ).where(table.c.variable.in_({y for x in rules for y in x.variables}))
+    watched = watched_stations(rules)
+    if watched is not None:
+        query = query.where(table.c.station_id.in_(watched))
+    latest = {(x[0], x[1]): (x[2], x[3]) for x in session.execute(query)}
+    violations = []
+    for rule in rules:
+        stations = rule.stations
+        if stations is None:
+            stations = sorted({x[0] for x in latest})
+        for station_id in stations:
+            for variable in rule.variables:
+                timestamp, value = latest.get((station_id, variable), (None, None))
+                if rule.max_age is not None and (
+                    timestamp is None or now - timestamp > rule.max_age * 60
+                ):
+                    violations.append(
+                        Violation(
+                            station_id,
+                            variable,
+                            "stale",
+                            f"Station {station_id}: no {variable} for more than {rule.max_age} min",
+                        )
+                    )
+                    continue
+                if value is None:
+                    continue
+                if (rule.minimum is not None and value < rule.minimum) or (
+                    rule.maximum is not None and value > rule.maximum
+                ):
+                    violations.append(
+                        Violation(
+                            station_id,
+                            variable,
+                            "bounds",
+                            f"Station {station_id}: {variable} {value} outside [{rule.minimum}, {rule.maximum}]",
+                        )
+                    )
+    return violations
+
+
+def check_flatlines(session: Session, rules: List[Rule], now: int) -> List[Violation]:
+    by_name = {x.name: x for x in FEEDS}
+    violations = []
+    variables = {y for x in rules if x.flatline for y in x.variables}
+    for variable in variables:
+        feed = by_name[variable]
+        table = feeds.feed_table(feed)
+        value = table.c[feed.columns[0].target]
+        relevant = [x for x in rules if x.flatline and variable in x.variables]
+        flagged = set()
+        # one query per distinct window, so a short window is not hidden by a
+        # longer one configured for other stations
+        for window in sorted({x.flatline for x in relevant}):
+            query = (
+                sqlalchemy.select(
+                    table.c.station_id,
+                    sqlalchemy.func.min(value),
+                    sqlalchemy.func.max(value),
+                    sqlalchemy.func.count(value),
+                )
+                .where(table.c.timestamp >= now - window * 60)
+                .group_by(table.c.station_id)
+            )
+            stations = watched_stations([x for x in relevant if x.flatline == window])
+            if stations is not None:
+                query = query.where(table.c.station_id.in_(stations))
+            for station_id, low, high, count in session.execute(query):
+                if count > 1 and low == high and station_id not in flagged:
+                    flagged.add(station_id)
+                    violations.append(
+                        Violation(
+                            station_id,
+                            variable,
+                            "flatline",
+                            f"Station {station_id}: {variable} stuck at {low} for {window} min",
+                        )
+                    )
+    return violations
+
+
+def evaluate(session: Session, rules: List[Rule]) -> List[Violation]:
+    now = models.to_epoch(datetime.now(timezone.utc))
+    return check_latest(session, rules, now) + check_flatlines(session, rules, now)
+
+
+def violation_key(a: Violation) -> str:
+    return f"{a.kind}:{a.station_id}:{a.variable}"
+
+
+def recently_notified(session: Session, keys: List[str], cooldown: int) -> set:
+    cutoff = datetime.now() - timedelta(minutes=cooldown)
+    return {
+        x[0]
+        for x in session.query(models.Notification.key)
+        .filter(models.Notification.key.in_(keys))
+        .filter(models.Notification.timestamp > cutoff)
+        .distinct()
+    }
+
+
+def error_stamp_due(cooldown: int, path: str = ERROR_STAMP) -> bool:
+    # cooldown for the error message when the database cannot be reached
+    if not os.path.exists(path):
+        return True
+    return time.time() - os.path.getmtime(path) > cooldown * 60
 
-    cutoff = dt - timedelta(hours=2)
 
-    if (
-        session.query(models.TemperatureMeasurement)
-        .filter(models.TemperatureMeasurement.timestamp > cutoff)
-        .filter(models.TemperatureMeasurement.station_id == station_id)
-        .count()
-        == 0
-    ):
-        return True
-    if (
-        session.query(models.HumidityMeasurement)
-        .filter(models.HumidityMeasurement.timestamp > cutoff)
-        .filter(models.HumidityMeasurement.station_id == station_id)
-        .count()
-        == 0
-    ):
-        return True
-    return False
+def touch(path: str) -> None:
+    with open(path, "a"):
+        os.utime(path)
 
 
-def msg_due(session: Session):
-    dt = datetime.now()
-    cutoff = dt - timedelta(days=1)
-    return session.query(models.Notification.timestamp > cutoff).count() == 0
+def digest(violations: List[Violation]) -> str:
+    groups = defaultdict(list)
+    for x in violations:
+        groups[(x.kind, x.variable)].append(x)
+    lines = []
+    for (kind, variable), group in groups.items():
+        if len(group) > DIGEST_THRESHOLD:
+            stations = ", ".join(str(x.station_id) for x in group)
+            lines.append(f"{kind} {variable} at {len(group)} stations: {stations}")
+        else:
+            lines += [x.message for x in group]
+    return "\n".join(lines)
 
 
 def monitor():
@@ -67,10 +221,33 @@ def monitor():
     session = Session()
     config = yaml.safe_load(open("conf/monitor.yaml"))
     try:
-        if measuremnts_too_old(session, config["station_id"]) and msg_due(session):
-            send_notification("There seems to be data missing", config, session=session)
+        violations = evaluate(session, load_rules(config))
+        cooldown = config.get("cooldown", DEFAULT_COOLDOWN)
+        keys = [violation_key(x) for x in violations]
+        notified = recently_notified(session, keys, cooldown)
+        due = [x for x, key in zip(violations, keys) if key not in notified]
+        if due:
+            send_notification(
+                digest(due),
+                config,
+                session=session,
+                keys=[violation_key(x) for x in due],
+            )
     except Exception as e:
-        send_notification(f"Could not corry or something {str(e)}", config)
+        message = f"Could not corry or something {str(e)}"
+        cooldown = config.get("cooldown", DEFAULT_COOLDOWN)
+        try:
+            session.rollback()
+            notified = recently_notified(session, [ERROR_KEY], cooldown)
+        except Exception:
+            logging.exception("Could not check the error cooldown")
+            if error_stamp_due(cooldown):
+                delivery_queue(config).submit(message, lambda: touch(ERROR_STAMP))
+            return
+        if ERROR_KEY not in notified:
+            send_notification(message, config, session=session, keys=[ERROR_KEY])
+    finally:
+        close_delivery_queue()
 
 
 if __name__ == "__main__":
@@ -1,4 +1,5 @@
 from dataclasses import dataclass
+from typing import Optional, Tuple
 
 import pandas
 
@@ -8,3 +9,45 @@ class MonthResult:
     data: pandas.DataFrame
     month: int
     year: int
+
+
+@dataclass(frozen=True)
+class PlotSpec:
+    builder: str
+    filename: str
+    data: pandas.DataFrame
+    args: dict
+
+
+@dataclass(frozen=True)
+class FeedColumn:
+    source: str
+    target: str
+    scale: float = 1.0
+    offset: float = 0.0
+
+
+@dataclass(frozen=True)
+class Feed:
+    name: str
+    url: str
+    table: str
+    columns: Tuple[FeedColumn, ...]
+
+
+@dataclass(frozen=True)
+class Rule:
+    variables: Tuple[str, ...]
+    stations: Optional[Tuple[int, ...]] = None
+    max_age: Optional[int] = None
+    minimum: Optional[float] = None
+    maximum: Optional[float] = None
+    flatline: Optional[int] = None
+
+
+@dataclass(frozen=True)
+class Violation:
+    station_id: int
+    variable: str
+    kind: str
+    message: str
@@ -0,0 +1,113 @@
+import logging
+import queue
+import random
+import smtplib
+import threading
+import time
+from email.message import EmailMessage
+from typing import Callable, Dict
+
+from origamibot import OrigamiBot as Bot
+
+DELIVERY_ATTEMPTS = 3
+BACKOFF_BASE = 2
+
+
+class TelegramTransport:
+    def __init__(self, token: str, chat_id):
+        self.bot = Bot(token)
+        self.chat_id = chat_id
+
+    def send(self, content: str) -> None:
+        self.bot.send_message(self.chat_id, content)
+
+
+class SmtpTransport:
+    def __init__(
+        self,
+        host: str,
+        sender: str,
+        recipient: str,
+        port: int = 0,
+        user: str = None,
+        password: str = None,
+    ):
+        self.host = host
+        self.port = port
+        self.sender = sender
+        self.recipient = recipient
+        self.user = user
+        self.password = password
+
+    def send(self, content: str) -> None:
+        message = EmailMessage()
+        message.set_content(content)
+        message["Subject"] = "meteogetter"
+        message["From"] = self.sender
+        message["To"] = self.recipient
+        with smtplib.SMTP(self.host, self.port) as smtp:
+            if self.user:
+                smtp.starttls()
+                smtp.login(self.user, self.password)
+            smtp.send_message(message)
+
+
+class FileTransport:
+    def __init__(self, path: str):
+        self.path = path
+
+    def send(self, content: str) -> None:
+        with open(self.path, "a") as f:
+            f.write(content + "\n\n")
+
+
+def transport_from_config(config: Dict):
+    kind = config.get("transport", "telegram")
+    if kind == "telegram":
+        return TelegramTransport(config["token"], config["chat_id"])
+    if kind == "smtp":
+        return SmtpTransport(**config["smtp"])
+    if kind == "file":
+        return FileTransport(config["path"])
+    raise ValueError(f"Unknown transport {kind}")
+
+
+class DeliveryQueue:
+    def __init__(self, transport):
+        self.transport = transport
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self.work, daemon=True)
+        self.thread.start()
+
+    def submit(self, content: str, on_delivered: Callable[[], None] = None) -> None:
+        self.queue.put((content, on_delivered))
+
+    def deliver(self, content: str) -> bool:
+        for attempt in range(DELIVERY_ATTEMPTS):
+            try:
+                self.transport.send(content)
+                return True
+            except Exception as e:
+                logging.warning(f"Delivery failed (attempt {attempt + 1}): {e}")
+            if attempt + 1 < DELIVERY_ATTEMPTS:
+                delay = BACKOFF_BASE * 2**attempt
+                time.sleep(delay + random.uniform(0, delay))
+        return False
+
+    def work(self) -> None:
+        while True:
+            item = self.queue.get()
+            try:
+                if item is None:
+                    return
+                content, on_delivered = item
+                if self.deliver(content) and on_delivered is not None:
+                    on_delivered()
+            except Exception:
+                logging.exception("Recording a delivered message failed")
+            finally:
+                self.queue.task_done()
+
+    def close(self, timeout: float = None) -> None:
+        self.queue.put(None)
+        self.thread.join(timeout)
@@ -0,0 +1,187 @@
+import datetime
+import glob
+import logging
+import os
+from typing import List
+
+import pandas
+import sqlalchemy
+from sqlalchemy import Column
+from sqlalchemy.orm import Session
+
+import feeds
+import models
+import rollups
+from mytypes import Feed
+
+ARCHIVE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "archive")
+ARCHIVE_FORMAT = "%Y-%m"
+RETENTION_MONTHS = 12
+ENGINES = {}
+
+
+def month_bounds(month: pandas.Period) -> (int, int):
+    return (
+        models.to_epoch(month.start_time.to_pydatetime()),
+        models.to_epoch((month + 1).start_time.to_pydatetime()),
+    )
+
+
+def archive_path(month: pandas.Period, directory: str = ARCHIVE_DIR) -> str:
+    return os.path.join(directory, f"{month.strftime(ARCHIVE_FORMAT)}.db")
+
+
+def archived_months(directory: str = ARCHIVE_DIR) -> List[pandas.Period]:
+    names = [os.path.basename(x)[:-3] for x in glob.glob(f"{directory}/*.db")]
+    return sorted(pandas.Period(x, "M") for x in names)
+
+
+def route(
+    start: int = None, end: int = None, directory: str = ARCHIVE_DIR
+) -> List[str]:
+    # archived months overlapping [start, end); the live table only holds the
+    # retention window, so it is always read as well
+    paths = []
+    for month in archived_months(directory):
+        low, high = month_bounds(month)
+        if (start is None or high > start) and (end is None or low < end):
+            paths.append(archive_path(month, directory))
+    return paths
+
+
+def archive_table(table: sqlalchemy.Table, schema: str = None) -> sqlalchemy.Table:
+    return sqlalchemy.Table(
+        table.name,
+        sqlalchemy.MetaData(),
+        *[Column(x.name, x.type, primary_key=x.primary_key) for x in table.c],
+        schema=schema,
+    )
+
+
+def months_with_rows(
+    connection, table: sqlalchemy.Table, end: int = None
+) -> List[pandas.Period]:
+    query = sqlalchemy.select(
+        sqlalchemy.distinct(
+            sqlalchemy.cast(table.c.timestamp / 86400, sqlalchemy.Integer)
+        )
+    )
+    if end is not None:
+        query = query.where(table.c.timestamp < end)
+    return sorted(
+        {
+            pandas.Period(datetime.datetime.utcfromtimestamp(x * 86400), "M")
+            for x, in connection.execute(query)
+        }
+    )
+
+
+def expired_months(
+    session, table: sqlalchemy.Table, cutoff: pandas.Period
+) -> List[pandas.Period]:
+    # only months that actually hold rows, so no empty archives are written
+    end, _ = month_bounds(cutoff)
+    return months_with_rows(session, table, end)
+
+
+def archive_engine(path: str):
+    if path not in ENGINES:
+        ENGINES[path] = sqlalchemy.create_engine("sqlite:///" + path)
+    return ENGINES[path]
+
+
+def remove_empty_archives(directory: str = ARCHIVE_DIR) -> None:
+    for month in archived_months(directory):
+        path = archive_path(month, directory)
+        engine = archive_engine(path)
+        with engine.connect() as connection:
+            empty = all(
+                connection.exec_driver_sql(f"SELECT 1 FROM {x} LIMIT 1").first() is None
+                for x in sqlalchemy.inspect(connection).get_table_names()
+            )
+        if empty:
+            ENGINES.pop(path).dispose()
+            os.remove(path)
+            logging.info(f"Removed empty archive {path}")
+
+
+def archive_month(
+    engine, feed_list: List[Feed], month: pandas.Period, directory: str
+) -> None:
+    low, high = month_bounds(month)
+    path = archive_path(month, directory)
+    # the attached database only lives as long as this connection
+    with engine.connect() as connection:
+        connection.execute(
+            sqlalchemy.text("ATTACH DATABASE :path AS archive"), {"path": path}
+        )
+        session = Session(bind=connection)
+        try:
+            for feed in feed_list:
+                table = feeds.feed_table(feed)
+                archived = archive_table(table, "archive")
+                archived.create(session.connection(), checkfirst=True)
+                in_month = sqlalchemy.and_(
+                    table.c.timestamp >= low, table.c.timestamp < high
+                )
+                columns = [x.name for x in table.c]
+                session.execute(
+                    archived.insert()
+                    .prefix_with("OR IGNORE")
+                    .from_select(columns, sqlalchemy.select(table).where(in_month))
+                )
+                # the archive holds the complete month, including rows archived
+                # by earlier runs, so rollups computed from it are exact
+                for seconds, rollup in rollups.ROLLUPS.items():
+                    rollups.upsert(
+                        session,
+                        rollup,
+                        rollups.aggregate(
+                            session, feed, seconds, low, end=high, table=archived
+                        ),
+                    )
+                session.execute(table.delete().where(in_month))
+            session.commit()
+        finally:
+            session.close()
+            connection.execute(sqlalchemy.text("DETACH DATABASE archive"))
+
+
+def enforce_retention(
+    session,
+    feed_list: List[Feed],
+    months: int = RETENTION_MONTHS,
+    directory: str = ARCHIVE_DIR,
+) -> None:
+    if session.get_bind().dialect.name != "sqlite":
+        logging.warning("Monthly archives are only supported on SQLite")
+        return
+    cutoff = pandas.Period(datetime.datetime.utcnow(), "M") - months
+    expired = set()
+    for feed in feed_list:
+        expired.update(expired_months(session, feeds.feed_table(feed), cutoff))
+    remove_empty_archives(directory)
+    if not expired:
+        return
+    session.commit()
+    engine = session.get_bind()
+    os.makedirs(directory, exist_ok=True)
+    for month in sorted(expired):
+        logging.info(f"Archiving {month}")
+        archive_month(engine, feed_list, month, directory)
+    with engine.connect() as connection:
+        connection.exec_driver_sql("VACUUM")
+
+
+def run_retention():
+    from sqlalchemy.orm import sessionmaker
+
+    from main import FEEDS, configure_logging, get_db_uri
+
+    configure_logging()
+    engine = sqlalchemy.create_engine(get_db_uri())
+    enforce_retention(sessionmaker(bind=engine)(), FEEDS)
+
+
+if __name__ == "__main__":
+    run_retention()
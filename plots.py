@@ -0,0 +1,82 @@
+import pandas
+import plotnine
+from mizani.breaks import date_breaks
+from mizani.formatters import date_format
+from plotnine import labeller
+
+# Bump when the look of the plots changes so cached renders are redone
+VERSION = 1
+BASE_VARIABLES = {
+    "temperature": "Temperature / °C",
+    "humidity": "Humidity %",
+    "dew_point": "Dew point / °C",
+}
+
+months = {
+    1: "Jan",
+    2: "Feb",
+    3: "Mar",
+    4: "Apr",
+    5: "May",
+    6: "Jun",
+    7: "Jul",
+    8: "Aug",
+    9: "Sep",
+    10: "Oct",
+    11: "Nov",
+    12: "Dec",
+}
+
+
+def labeller_month(a) -> str:
+    try:
+        b = int(a)
+        if 1 <= b <= 12:
+            return months[b]
+    except Exception:
+        pass
+    return ""
+
+
+def line_plot(data: pandas.DataFrame, colname: str) -> plotnine.ggplot:
+    return (
+        plotnine.ggplot(
+            data, plotnine.aes(x="timestamp", y="value", color="type", group="type")
+        )
+        + plotnine.geom_line()
+        + plotnine.theme(
+            axis_text_x=plotnine.element_text(angle=90), figure_size=(32, 16)
+        )
+        + plotnine.ylab(BASE_VARIABLES[colname])
+        + plotnine.ggtitle(BASE_VARIABLES[colname])
+        + plotnine.xlab("Month")
+        + plotnine.themes.theme_dark()
+        + plotnine.scale_x_datetime(
+            breaks=date_breaks("1 month"), labels=date_format("%m")
+        )
+    )
+
+
+def hist_plot(
+    data: pandas.DataFrame, colname: str, label_name: str, daytime: str
+) -> plotnine.ggplot:
+    return (
+        plotnine.ggplot(data=data)
+        + plotnine.aes(x=colname)
+        + plotnine.geom_histogram()
+        + plotnine.ggtitle(f"{daytime} {colname}")
+        + plotnine.xlab(label_name)
+        + plotnine.facet_wrap(
+            "~  month",
+            labeller=labeller(
+                cols=labeller_month,
+                rows=labeller_month,
+                default=labeller_month,
+                multi_line=False,
+            ),
+        )
+        + plotnine.themes.theme_dark()
+    )
+
+
+BUILDERS = {"line": line_plot, "hist": hist_plot}
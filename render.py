@@ -0,0 +1,84 @@
+import hashlib
+import itertools
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional
+
+import pandas
+
+import plots
+from files import write_atomically
+from mytypes import PlotSpec
+
+CACHE_FILE = ".render_cache.json"
+
+
+def spec_key(spec: PlotSpec) -> str:
+    h = hashlib.sha256()
+    h.update(pandas.util.hash_pandas_object(spec.data, index=False).values.tobytes())
+    h.update(
+        json.dumps(
+            [
+                plots.VERSION,
+                spec.builder,
+                spec.filename,
+                spec.args,
+                list(spec.data.columns),
+            ],
+            sort_keys=True,
+            default=str,
+        ).encode()
+    )
+    return h.hexdigest()
+
+
+def read_cache(directory: str) -> dict:
+    path = os.path.join(directory, CACHE_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def write_cache(directory: str, cache: dict) -> None:
+    def write(path):
+        with open(path, "w") as f:
+            json.dump(cache, f, indent=2, sort_keys=True)
+
+    write_atomically(os.path.join(directory, CACHE_FILE), write)
+
+
+def render_plot(spec: PlotSpec, directory: str) -> str:
+    plot = plots.BUILDERS[spec.builder](spec.data, **spec.args)
+    path = os.path.join(directory, spec.filename)
+    write_atomically(path, lambda x: plot.save(filename=x, verbose=False))
+    return path
+
+
+def render_plots(
+    specs: List[PlotSpec],
+    directory: str,
+    workers: Optional[int] = None,
+    force: bool = False,
+) -> List[str]:
+    os.makedirs(directory, exist_ok=True)
+    cache = {} if force else read_cache(directory)
+    keys = [spec_key(x) for x in specs]
+    stale = [
+        (x, key)
+        for x, key in zip(specs, keys)
+        if cache.get(x.filename) != key
+        or not os.path.exists(os.path.join(directory, x.filename))
+    ]
+    if not stale:
+        return []
+    todo = [x for x, _ in stale]
+    if workers == 1:
+        paths = [render_plot(x, directory) for x in todo]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            paths = list(pool.map(render_plot, todo, itertools.repeat(directory)))
+    cache.update({x.filename: key for x, key in stale})
+    write_cache(directory, cache)
+    return paths
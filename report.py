@@ -1,229 +1,192 @@
 import datetime
-import math
 import os.path
 import typing
-from functools import lru_cache
 from typing import Dict, Tuple
 import argparse
 
+import numpy
 import pandas
-import plotnine
 import sqlalchemy
 
-from mizani.breaks import date_breaks
-from mizani.formatters import date_format
-from dateutil.rrule import rrule, MONTHLY
-from pandas import Timestamp
-from plotnine import labeller
 from pytz import timezone
-from skyfield import api
 from sqlalchemy.orm import sessionmaker
 
+import artifacts
+import derived
+import ephemeris
+import loader
 import models
+import render
+import stats
 from main import get_db_uri
-from mytypes import MonthResult
+from mytypes import MonthResult, PlotSpec
+from plots import BASE_VARIABLES
 
 ALIGNMENT_CUTOFF = datetime.timedelta(minutes=30)
+STATION_ID = 24
 LATITUDE = 47.4
 LONGITUDE = 8.05
 TIMEZONE = timezone("Europe/Berlin")
 COLNAMES = ["temperature", "humidity", "dew_point"]
-TOWN = api.wgs84.latlon(LATITUDE, LONGITUDE)
-EPH = api.load("de421.bsp")
-TIMESCALE = api.load.timescale()
-BASE_VARIABLES = {
-    "temperature": "Temperature / °C",
-    "humidity": "Humidity %",
-    "dew_point": "Dew point / °C",
-}
+DEW_POINT_FORMULA = "crude"
 NAME_BALCONY = "balcony"
 NAME_METEO = "meteo"
-TEMP_PATH = "temp_matched_vals.csv"
-TEMP_PATH_TIDIED = "temp_tidied.pickle"
+PATH_BALCONY = "BALCONY.CSV"
 SUFFIX_METEO = "_meteo"
 SUFFIX_BALCONY = "_balcony"
 PATH_REPORT = "report/"
-from skyfield import almanac
+STATION_IDS = {NAME_BALCONY: stats.NO_STATION, NAME_METEO: STATION_ID}
 
 
-def is_night(row: pandas.Series) -> bool:
-    timestamp = row["timestamp"]
-    timestamp_localized = TIMEZONE.localize(timestamp)
-    sunrise, sunset = (
-        Timestamp(ts_input=x.utc_datetime()) for x in find_sunrise_sunset(timestamp)[0]
-    )
-    return timestamp_localized < sunrise or timestamp_localized > sunset
-
-
-def is_morning(row: pandas.Series) -> bool:
-    timestamp = row["timestamp"]
-    timestamp_localized = TIMEZONE.localize(timestamp)
-    sunrise, sunset = (
-        Timestamp(ts_input=x.utc_datetime()) for x in find_sunrise_sunset(timestamp)[0]
-    )
-    noon = sunrise + ((sunset - sunrise) / 2)
-    return sunrise < timestamp_localized < noon
-
-    sunrise, sunset = (
-        Timestamp(ts_input=x.utc_datetime()) for x in find_sunrise_sunset(timestamp)[0]
-    )
-
-
-def is_afternoon(row: pandas.Series) -> bool:
-    timestamp = row["timestamp"]
-    timestamp_localized = TIMEZONE.localize(timestamp)
-    sunrise, sunset = (
-        Timestamp(ts_input=x.utc_datetime()) for x in find_sunrise_sunset(timestamp)[0]
-    )
-    noon = sunrise + ((sunset - sunrise) / 2)
-    return noon < timestamp_localized < sunset
-
-
-@lru_cache()
-def find_sunrise_sunset(timestamp: Timestamp):
-    start = TIMESCALE.from_datetime(
-        TIMEZONE.localize(
-            Timestamp(year=timestamp.year, month=timestamp.month, day=timestamp.day)
-        )
+def add_daytime(a: pandas.DataFrame) -> pandas.DataFrame:
+    b = a.copy()
+    b["daytime"] = ephemeris.classify_daytime(
+        b["timestamp"], LATITUDE, LONGITUDE, TIMEZONE
     )
-    end = TIMESCALE.from_datetime((start + pandas.Timedelta(days=1)).utc_datetime())
-    return find_sunrise_sunset_helper(start, end)
-
-
-@lru_cache
-def find_sunrise_sunset_helper(start: datetime.datetime, end: datetime.datetime):
-    return almanac.find_discrete(start, end, almanac.sunrise_sunset(EPH, TOWN))
-
-
-def calculate_crude_dew_point_for_row(row: pandas.Series):
-    if math.isnan(row["temperature"]):
-        return None
-    if math.isnan(row["humidity"]):
-        return None
-    return row["temperature"] - ((100 - row["humidity"]) / 5)
-
-
-def calculate_crude_dew_point(a: pandas.DataFrame):
-    a["dew_point"] = a.apply(calculate_crude_dew_point_for_row, axis=1)
-
-
-def pair_closest_datapoint_in_time(
-    a: pandas.Series, a_name: str, b: pandas.DataFrame, colnames: [str]
-) -> pandas.Series:
-    timestamp = a["timestamp"]
-    start = timestamp - ALIGNMENT_CUTOFF
-    end = timestamp + ALIGNMENT_CUTOFF
-    candidates = b.query("timestamp > @start and timestamp < @end")
-    if len(candidates) == 0:
-        return None
-    else:
-        asdf = candidates.loc[[b["timestamp"].sub(timestamp).abs().idxmin()]]
-        res = {}
-        for colname in colnames:
-            res[f"{colname}_{a_name}"] = a[colname]
-            res[f"{colname}_{b.name}"] = (asdf[colname]).values[0]
-            res[f"delta_{colname}"] = (asdf[colname] - a[colname]).values[0]
-        res["timestamp"] = timestamp
-        series = pandas.Series(res)
-        if series.isnull().any():
-            return None
-        return series
+    return b
 
 
 def match_values(
     a: pandas.DataFrame, b: pandas.DataFrame, colnames: [str]
 ) -> pandas.DataFrame:
-    temp = [
-        pair_closest_datapoint_in_time(x[1], a.name, b, colnames) for x in a.iterrows()
+    left = (
+        a[["timestamp"] + colnames]
+        .dropna(subset=["timestamp"])
+        .sort_values("timestamp")
+        .rename(columns={x: f"{x}_{a.name}" for x in colnames})
+    )
+    right = (
+        b[["timestamp"] + colnames]
+        .dropna(subset=["timestamp"])
+        .sort_values("timestamp")
+        .rename(columns={x: f"{x}_{b.name}" for x in colnames})
+    )
+    right["timestamp_match"] = right["timestamp"]
+    matched = pandas.merge_asof(
+        left,
+        right,
+        on="timestamp",
+        direction="nearest",
+        tolerance=pandas.Timedelta(ALIGNMENT_CUTOFF),
+    )
+    # merge_asof's tolerance is inclusive, the cutoff is not
+    matched = matched[
+        (matched["timestamp_match"] - matched["timestamp"]).abs() < ALIGNMENT_CUTOFF
     ]
-    return pandas.DataFrame.from_records([x for x in temp if x is not None])
+    res = pandas.DataFrame(index=matched.index)
+    for colname in colnames:
+        res[f"{colname}_{a.name}"] = matched[f"{colname}_{a.name}"]
+        res[f"{colname}_{b.name}"] = matched[f"{colname}_{b.name}"]
+        res[f"delta_{colname}"] = (
+            res[f"{colname}_{b.name}"] - res[f"{colname}_{a.name}"]
+        )
+    res["timestamp"] = matched["timestamp"]
+    return res.dropna().reset_index(drop=True)
 
 
-def query_db_to_dataframe(session, cls_to_query) -> pandas.DataFrame:
-    vals = session.query(cls_to_query).filter(cls_to_query.station_id == 24).all()
-    datty_frame: pandas.DataFrame = pandas.DataFrame.from_records(
-        [x.to_dict() for x in vals]
+def query_db_to_dataframe(session, variable: str) -> pandas.DataFrame:
+    return loader.load_measurements(
+        session.connection(), variable, station_id=STATION_ID
     )
-    datty_frame["timestamp"] = pandas.to_datetime(datty_frame["timestamp"])
-    return datty_frame
 
 
 def fetch_meteo_dataframe(session) -> pandas.DataFrame:
-    meteo_temps: pandas.DataFrame = query_db_to_dataframe(
-        session, models.TemperatureMeasurement
-    ).drop(columns=["station_id"])
+    meteo_temps: pandas.DataFrame = query_db_to_dataframe(session, "temperature").drop(
+        columns=["station_id"]
+    )
     meteo_humidities: pandas.DataFrame = query_db_to_dataframe(
-        session, models.HumidityMeasurement
+        session, "humidity"
     ).drop(columns=["station_id"])
     res = meteo_humidities.merge(meteo_temps, on="timestamp", how="left")
     res.name = "meteo"
-    calculate_crude_dew_point(res)
+    derived.add_dew_point(res, DEW_POINT_FORMULA)
+    return res
+
+
+def meteo_fingerprint(session) -> str:
+    table = models.LatestMeasurement.__table__
+    latest = session.execute(
+        sqlalchemy.select(table.c.variable, table.c.timestamp)
+        .where(table.c.station_id == STATION_ID)
+        .order_by(table.c.variable)
+    )
+    return artifacts.fingerprint(
+        STATION_ID, DEW_POINT_FORMULA, [tuple(x) for x in latest]
+    )
+
+
+def load_meteo_dataframe(session, key: str) -> pandas.DataFrame:
+    res = artifacts.cached(NAME_METEO, key, lambda: fetch_meteo_dataframe(session))
+    res.name = NAME_METEO
     return res
 
 
 def read_balcony_data():
-    balcony = pandas.read_csv("BALCONY.CSV")
+    balcony = pandas.read_csv(PATH_BALCONY)
     balcony["timestamp"] = pandas.to_datetime(balcony["timestamp"])
     balcony.name = "balcony"
-    calculate_crude_dew_point(balcony)
+    derived.add_dew_point(balcony, DEW_POINT_FORMULA)
     return balcony
 
 
-def statsify(a: pandas.DataFrame):
-    b = a.resample("M", on="timestamp").mean()
-    c = a.resample("D", on="timestamp").mean().resample("M").min()
-    d = a.resample("D", on="timestamp").mean().resample("M").max()
-    return b.join(c, rsuffix="_low").join(d, rsuffix="_high")
-
-
 def write_stats(
-    a: typing.Tuple[pandas.DataFrame, str], b: typing.Tuple[pandas.DataFrame, str]
+    session,
+    a: typing.Tuple[pandas.DataFrame, str],
+    b: typing.Tuple[pandas.DataFrame, str],
 ) -> None:
     path_a = os.path.join(PATH_REPORT, f"{a[1]}.html")
     path_b = os.path.join(PATH_REPORT, f"{b[1]}.html")
     path_delta = os.path.join(PATH_REPORT, f"delta.html")
+    stats.update_stats(session, a[1], a[0], STATION_IDS[a[1]])
+    stats.update_stats(session, b[1], b[0], STATION_IDS[b[1]])
+    a_stats = stats.load_stats(session, a[1], STATION_IDS[a[1]])
+    b_stats = stats.load_stats(session, b[1], STATION_IDS[b[1]])
     with open(path_a, "w") as file_a, open(path_b, "w") as file_b, open(
         path_delta, "w"
     ) as file_delta:
-        counts = a[0].resample("M", on="timestamp").count()['temperature'].rename("count")
+        counts = a_stats["count"]["temperature"].rename("count")
 
-        a_new: pandas.DataFrame = statsify(a[0])
-        b_new: pandas.DataFrame = statsify(b[0])
+        a_new: pandas.DataFrame = stats.to_report_frame(a_stats)
+        b_new: pandas.DataFrame = stats.to_report_frame(b_stats)
         deltas: pandas.DataFrame = a_new.sub(b_new)
-        deltas.name = "deltas"
-        a_new.name = a[0].name
-        b_new.name = b[0].name
         file_a.write(a_new.join(counts).to_html())
         file_b.write(b_new.join(counts).to_html())
         file_delta.write(deltas.join(counts).to_html())
 
 
-def filter_df_by_month(df: pandas.DataFrame, m: int, y: int):
-    df_a = df[df["timestamp"].dt.month == m]
-    df_f = df_a[df_a["timestamp"].dt.year == y]
-    df_f.name = meteo.name
-    return df_f
+def partition_by_period(
+    df: pandas.DataFrame, freq: str = "M"
+) -> Dict[pandas.Period, pandas.DataFrame]:
+    b = df.sort_values("timestamp", kind="stable")
+    periods = b["timestamp"].dt.to_period(freq).array
+    ordinals = periods.asi8
+    bounds = numpy.flatnonzero(ordinals[1:] != ordinals[:-1]) + 1
+    starts = numpy.concatenate([[0], bounds])
+    ends = numpy.concatenate([bounds, [len(b)]])
+    res = {}
+    for start, end in zip(starts, ends):
+        if end > start:
+            res[periods[start]] = b.iloc[start:end]
+            res[periods[start]].name = getattr(df, "name", None)
+    return res
 
 
 def split_by_month_and_year(df: pandas.DataFrame) -> Dict[Tuple[int, int], MonthResult]:
-    start, end = min(df["timestamp"]), max(df["timestamp"])
-    diff_month = lambda e, s: (e.year - s.year) * 12 + e.month - s.month
-
-    months = [
-        (d.month, d.year)
-        for d in rrule(MONTHLY, count=diff_month(end, start) + 1, dtstart=start)
-    ]
-    return {(m, y): MonthResult(filter_df_by_month(df, m, y), m, y) for m, y in months}
+    return {
+        (p.month, p.year): MonthResult(x, p.month, p.year)
+        for p, x in partition_by_period(df, "M").items()
+    }
 
 
-def plot_by_month(matched_vals: pandas.DataFrame):
-    a = plot_matched(matched_vals)
+def plot_by_month(matched_vals: pandas.DataFrame, key: str):
+    a = plot_matched(matched_vals, key)
 
+    with_daytime = add_daytime(matched_vals)
     b = plot_histogram_by_daytime(
-        matched_vals, "delta_temperature", "Δ Temperature /°C"
+        with_daytime, "delta_temperature", "Δ Temperature /°C"
     )
-    c = plot_histogram_by_daytime(matched_vals, "delta_humidity", "Δ Humidity %")
-    d = plot_histogram_by_daytime(matched_vals, "delta_dew_point", "Δ Dew Point /°C")
+    c = plot_histogram_by_daytime(with_daytime, "delta_humidity", "Δ Humidity %")
+    d = plot_histogram_by_daytime(with_daytime, "delta_dew_point", "Δ Dew Point /°C")
     return a + b + c + d
 
 
@@ -244,54 +207,15 @@ def time_melt(a: pandas.DataFrame, type) -> pandas.DataFrame:
     return b.melt(id_vars=["timestamp", "type"])
 
 
-months = {
-    1: "Jan",
-    2: "Feb",
-    3: "Mar",
-    4: "Apr",
-    5: "May",
-    6: "Jun",
-    7: "Jul",
-    8: "Aug",
-    9: "Sep",
-    10: "Oct",
-    11: "Nov",
-    12: "Dec",
-}
-
-
-def labeller_month(a) -> str:
-    try:
-        b = int(a)
-        if 1 <= b <= 12:
-            return months[b]
-    except Exception:
-        pass
-    return ""
-
-
-def plot_line(melted: pandas.DataFrame, colname, month: int = None):
-    my_filter = melted["month"] == 6
-    data = melted.loc[my_filter] if month else melted
-
-    asdf = (
-        plotnine.ggplot(
-            data, plotnine.aes(x="timestamp", y="value", color="type", group="type")
-        )
-        + plotnine.geom_line()
-        + plotnine.theme(
-            axis_text_x=plotnine.element_text(angle=90), figure_size=(32, 16)
-        )
-        + plotnine.ylab(BASE_VARIABLES[colname])
-        + plotnine.ggtitle(BASE_VARIABLES[colname])
-        + plotnine.xlab("Month")
-        + plotnine.themes.theme_dark()
-        + plotnine.scale_x_datetime(
-            breaks=date_breaks("1 month"), labels=date_format("%m")
-        )
-    )
+def plot_line(melted: pandas.DataFrame, colname, month: int = None) -> PlotSpec:
+    data = melted.loc[melted["month"] == month] if month else melted
     filename = f"{colname}-{month}.pdf" if month else f"{colname}.pdf"
-    return (asdf, filename)
+    return PlotSpec(
+        "line",
+        filename,
+        data[["timestamp", "value", "type"]],
+        {"colname": colname},
+    )
 
 
 def plot_histogram_by_daytime(
@@ -305,24 +229,12 @@ def plot_histogram_by_daytime(
     b["year"] = b.timestamp.dt.year
     b["month"] = b.timestamp.dt.month
     return [
-        plot_hists(
-            b[b.apply(lambda x: is_morning(x), axis=1)], colname, label_name, "morning"
-        ),
-        plot_hists(
-            b[b.apply(lambda x: is_afternoon(x), axis=1)],
-            colname,
-            label_name,
-            "afternoon",
-        ),
-        plot_hists(
-            b[b.apply(lambda x: is_night(x), axis=1)], colname, label_name, "night"
-        ),
+        plot_hists(b[b["daytime"] == x], colname, label_name, x)
+        for x in [ephemeris.MORNING, ephemeris.AFTERNOON, ephemeris.NIGHT]
     ]
 
 
 def tidy_matched(a: pandas.DataFrame, colname: str) -> pandas.DataFrame:
-    if args.load:
-        pandas.read_pickle(TEMP_PATH_TIDIED)
     b = a.melt(id_vars=["timestamp"])
     meteo = b.query("variable==" + "'" + colname + SUFFIX_METEO + "'").copy()
     balcony = b.query("variable==" + "'" + colname + SUFFIX_BALCONY + "'").copy()
@@ -333,92 +245,82 @@ def tidy_matched(a: pandas.DataFrame, colname: str) -> pandas.DataFrame:
     c = pandas.concat([meteo, balcony])
     c["year"] = c.timestamp.dt.year
     c["month"] = c.timestamp.dt.month
-    if args.save:
-        c.to_pickle(TEMP_PATH_TIDIED)
     return c
 
 
-def plot_matched(
-    a: pandas.DataFrame,
-) -> None:
+def plot_matched(a: pandas.DataFrame, key: str) -> None:
     if a.empty:
         return
     b = a.copy()
     b["year"] = b.timestamp.dt.year
     b["month"] = b.timestamp.dt.month
-    c = [(tidy_matched(b, k), k) for k, v in BASE_VARIABLES.items()]
+    c = [
+        (
+            artifacts.cached(
+                f"tidied_{k}",
+                artifacts.fingerprint(key, k),
+                lambda: tidy_matched(b, k),
+            ),
+            k,
+        )
+        for k in BASE_VARIABLES
+    ]
     plots = [plot_line(x, y) for x, y in c] + [plot_line(x, y, 6) for x, y in c]
 
     return plots
 
 
-def plot_hists(c: pandas.DataFrame, colname: str, label_name: str, daytime: str):
-    plot = (
-        plotnine.ggplot(data=c)
-        + plotnine.aes(x=colname)
-        + plotnine.geom_histogram()
-        + plotnine.ggtitle(f"{daytime} {colname}")
-        + plotnine.xlab(label_name)
-        + plotnine.facet_wrap(
-            "~  month",
-            labeller=labeller(
-                cols=labeller_month,
-                rows=labeller_month,
-                default=labeller_month,
-                multi_line=False,
-            ),
-        )
-        + plotnine.themes.theme_dark()
+def plot_hists(
+    c: pandas.DataFrame, colname: str, label_name: str, daytime: str
+) -> PlotSpec:
+    return PlotSpec(
+        "hist",
+        f"{colname}_{daytime}.pdf",
+        c[[colname, "month"]],
+        {"colname": colname, "label_name": label_name, "daytime": daytime},
     )
-    filename = f"{colname}_{daytime}.pdf"
-    return (plot, filename)
-
 
-def write_plots(plots_and_names):
-    for plot, name in plots_and_names:
-        plot.save(filename=os.path.join(PATH_REPORT, name))
 
-
-def load_matched_vals():
-    return pandas.read_csv(TEMP_PATH, parse_dates=["timestamp"])
+def write_plots(specs: [PlotSpec], workers: int = None, force: bool = False):
+    render.render_plots(specs, PATH_REPORT, workers, force)
 
 
 def compute_matched_vals(meteo, balcony):
-    temps = (
-        session.query(models.TemperatureMeasurement)
-        .filter(models.TemperatureMeasurement.station_id == 24)
-        .all()
-    )
-    matched_vals = match_values(
-        meteo, balcony, ["temperature", "humidity", "dew_point"]
-    )
-    if args.save:
-        matched_vals.to_csv()
-    return matched_vals
+    return match_values(meteo, balcony, COLNAMES)
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument(
-        "-l",
-        "--load",
-        help="Load previous derived data. Program will not work if there is none",
+        "-w",
+        "--workers",
+        help="Number of processes rendering plots, defaults to the CPU count",
+        type=int,
+    )
+    parser.add_argument(
+        "-r",
+        "--rerender",
+        help="Render all plots even if their data did not change",
         action="store_true",
     )
-    parser.add_argument("-s", "--save", help="Save derived data", action="store_true")
     args = parser.parse_args()
     engine = sqlalchemy.create_engine(get_db_uri())
     Session = sessionmaker(bind=engine)
     session = Session()
-    meteo = fetch_meteo_dataframe(session)
+    meteo_key = meteo_fingerprint(session)
+    meteo = load_meteo_dataframe(session, meteo_key)
     balcony = read_balcony_data()
-    matched_vals = (
-        load_matched_vals() if args.load else compute_matched_vals(meteo, balcony)
+    matched_key = artifacts.fingerprint(
+        meteo_key,
+        artifacts.file_fingerprint(PATH_BALCONY),
+        DEW_POINT_FORMULA,
+        ALIGNMENT_CUTOFF,
+    )
+    matched_vals = artifacts.cached(
+        "matched", matched_key, lambda: compute_matched_vals(meteo, balcony)
     )
-    if args.save:
-        matched_vals.to_csv(TEMP_PATH)
 
-    plots = plot_by_month(matched_vals)
+    plots = plot_by_month(matched_vals, matched_key)
 
-    write_plots(plots)
-    write_stats((balcony, NAME_BALCONY), (meteo, NAME_METEO))
+    write_plots(plots, args.workers, args.rerender)
+    write_stats(session, (balcony, NAME_BALCONY), (meteo, NAME_METEO))
@@ -0,0 +1,105 @@
+from typing import List
+
+import pandas
+import sqlalchemy
+from sqlalchemy.dialects import postgresql, sqlite
+
+import feeds
+import models
+from mytypes import Feed
+
+ROLLUPS = {
+    3600: models.HourlyRollup.__table__,
+    24 * 3600: models.DailyRollup.__table__,
+}
+AGGREGATES = ["minimum", "maximum", "mean", "count", "total"]
+
+
+def aggregate(
+    session,
+    feed: Feed,
+    seconds: int,
+    start: int = None,
+    stations=None,
+    end: int = None,
+    table: sqlalchemy.Table = None,
+) -> List[dict]:
+    if table is None:
+        table = feeds.feed_table(feed)
+    value = table.c[feed.columns[0].target]
+    bucket = (
+        sqlalchemy.cast(table.c.timestamp / seconds, sqlalchemy.Integer) * seconds
+    ).label("timestamp")
+    query = sqlalchemy.select(
+        table.c.station_id,
+        bucket,
+        sqlalchemy.func.min(value),
+        sqlalchemy.func.max(value),
+        sqlalchemy.func.avg(value),
+        sqlalchemy.func.count(value),
+        sqlalchemy.func.sum(value),
+    ).group_by(table.c.station_id, bucket)
+    if start is not None:
+        query = query.where(table.c.timestamp >= start)
+    if end is not None:
+        query = query.where(table.c.timestamp < end)
+    if stations is not None:
+        query = query.where(table.c.station_id.in_(stations))
+    return [
+        dict(
+            zip(["station_id", "timestamp"] + AGGREGATES, x),
+            variable=feed.name,
+        )
+        for x in session.execute(query)
+    ]
+
+
+def upsert(session, table: sqlalchemy.Table, records: List[dict]) -> None:
+    if not records:
+        return
+    dialect = session.get_bind().dialect.name
+    if dialect not in ("sqlite", "postgresql"):
+        keys = [table.c.station_id, table.c.variable, table.c.timestamp]
+        for x in records:
+            session.execute(
+                table.delete().where(sqlalchemy.and_(*[y == x[y.name] for y in keys]))
+            )
+        session.execute(table.insert(), records)
+        return
+    insert = (sqlite if dialect == "sqlite" else postgresql).insert(table)
+    session.execute(
+        insert.on_conflict_do_update(
+            index_elements=[table.c.station_id, table.c.variable, table.c.timestamp],
+            set_={x: insert.excluded[x] for x in AGGREGATES},
+        ),
+        records,
+    )
+
+
+def refresh(session, feed: Feed, a: pandas.DataFrame) -> None:
+    # Buckets touched by new rows are recomputed from the raw table, which
+    # keeps the rollups exact even if some of the rows were duplicates.
+    stations = [int(x) for x in a["station_id"].unique()]
+    for seconds, table in ROLLUPS.items():
+        start = int(a["timestamp"].min()) // seconds * seconds
+        upsert(session, table, aggregate(session, feed, seconds, start, stations))
+
+
+def backfill(session, feed_list: List[Feed]) -> None:
+    for feed in feed_list:
+        for seconds, table in ROLLUPS.items():
+            upsert(session, table, aggregate(session, feed, seconds))
+        session.commit()
+
+
+def run_backfill():
+    from sqlalchemy.orm import sessionmaker
+
+    from main import FEEDS, get_db_uri
+
+    engine = sqlalchemy.create_engine(get_db_uri())
+    backfill(sessionmaker(bind=engine)(), FEEDS)
+
+
+if __name__ == "__main__":
+    run_backfill()
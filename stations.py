@@ -0,0 +1,102 @@
+import pandas
+import sqlalchemy
+
+import models
+
+STATION_COLUMNS = {
+    "Abbr.": "abbr",
+    "Station": "name",
+    "Latitude": "latitude",
+    "Longitude": "longitude",
+    "Measurement height m a. sea level": "altitude",
+    "More information m a. ground": "height",
+}
+METADATA = ["name", "latitude", "longitude", "altitude", "height"]
+
+
+class StationRegistry:
+    def __init__(self):
+        self.stations = pandas.DataFrame(columns=["id"] + METADATA)
+        self.max_id = None
+
+    @property
+    def ids(self) -> dict:
+        return self.stations["id"].to_dict()
+
+    def refresh(self, session) -> None:
+        table = models.Station.__table__
+        a = pandas.read_sql_query(
+            sqlalchemy.select(
+                table.c.id, table.c.abbr, *[table.c[x] for x in METADATA]
+            ),
+            session.connection(),
+        )
+        self.stations = a.set_index("abbr")
+        self.max_id = a["id"].max() if not a.empty else None
+
+    def is_stale(self, session) -> bool:
+        # other writers only ever add stations, so the highest id tells us
+        # whether the cached map is still complete
+        max_id = session.query(sqlalchemy.func.max(models.Station.id)).scalar()
+        return max_id != self.max_id or self.max_id is None
+
+    def sync(
+        self,
+        frames: [pandas.DataFrame],
+        session,
+        primary: pandas.DataFrame = None,
+    ) -> dict:
+        if self.is_stale(session):
+            self.refresh(session)
+        seen = station_rows(frames)
+        table = models.Station.__table__
+        new = seen[~seen.index.isin(self.stations.index)]
+        if not new.empty:
+            session.execute(table.insert(), to_records(new))
+        # feeds disagree on some metadata, so known stations are only updated
+        # from one fixed feed; otherwise the stored values would flip with the
+        # set of feeds that happened to change this cycle
+        known = station_rows([primary] if primary is not None else [])
+        known = known[known.index.isin(self.stations.index)]
+        changed = changed_rows(known, self.stations.loc[known.index, METADATA])
+        if not changed.empty:
+            session.execute(
+                table.update()
+                .where(table.c.abbr == sqlalchemy.bindparam("b_abbr"))
+                .values({x: sqlalchemy.bindparam(x) for x in METADATA}),
+                to_records(changed.rename_axis("b_abbr")),
+            )
+        if not new.empty or not changed.empty:
+            session.commit()
+            self.refresh(session)
+        return self.ids
+
+
+def station_rows(frames: [pandas.DataFrame]) -> pandas.DataFrame:
+    usable = [
+        x[list(STATION_COLUMNS)]
+        for x in frames
+        if all(y in x.columns for y in STATION_COLUMNS)
+    ]
+    if not usable:
+        return pandas.DataFrame(columns=METADATA, index=pandas.Index([], name="abbr"))
+    return (
+        pandas.concat(usable)
+        .rename(columns=STATION_COLUMNS)
+        .dropna(subset=["abbr"])
+        .drop_duplicates("abbr")
+        .set_index("abbr")
+    )
+
+
+def changed_rows(a: pandas.DataFrame, b: pandas.DataFrame) -> pandas.DataFrame:
+    changed = pandas.Series(False, index=a.index)
+    for x in METADATA:
+        same = (a[x] == b[x]) | (a[x].isna() & b[x].isna())
+        changed |= ~same
+    return a[changed]
+
+
+def to_records(a: pandas.DataFrame) -> [dict]:
+    b = a.reset_index()
+    return b.astype(object).where(b.notna(), None).to_dict("records")
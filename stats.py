@@ -0,0 +1,86 @@
+import pandas
+import sqlalchemy
+
+import models
+
+NO_STATION = 0
+STATISTICS = ["mean", "low", "high", "count"]
+
+
+def compute_monthly_stats(a: pandas.DataFrame) -> pandas.DataFrame:
+    b = a.set_index("timestamp").select_dtypes("number")
+    monthly = b.resample("M")
+    daily = b.resample("D").mean().resample("M")
+    res = pandas.concat(
+        {
+            "mean": monthly.mean().stack(dropna=False),
+            "low": daily.min().stack(dropna=False),
+            "high": daily.max().stack(dropna=False),
+            "count": monthly.count().stack(dropna=False),
+        },
+        axis=1,
+    )
+    res.index.names = ["timestamp", "variable"]
+    res = res.reset_index()
+    res["month"] = models.series_to_epoch(
+        res["timestamp"].dt.to_period("M").dt.to_timestamp()
+    )
+    return res.drop(columns=["timestamp"])
+
+
+def latest_stored_month(session, source: str, station_id: int):
+    return (
+        session.query(sqlalchemy.func.max(models.MonthlyStatistic.month))
+        .filter(models.MonthlyStatistic.source == source)
+        .filter(models.MonthlyStatistic.station_id == station_id)
+        .scalar()
+    )
+
+
+def update_stats(
+    session, source: str, a: pandas.DataFrame, station_id: int = NO_STATION
+) -> None:
+    # Everything before the newest stored month is closed; the newest one
+    # may have been partial when it was stored, so it is recomputed.
+    latest = latest_stored_month(session, source, station_id)
+    if latest is not None:
+        a = a[a["timestamp"] >= pandas.Timestamp(latest, unit="s")]
+    if a.empty:
+        return
+    res = compute_monthly_stats(a)
+    res["source"] = source
+    res["station_id"] = station_id
+    table = models.MonthlyStatistic.__table__
+    session.execute(
+        table.delete()
+        .where(table.c.source == source)
+        .where(table.c.station_id == station_id)
+        .where(table.c.month >= int(res["month"].min()))
+    )
+    session.execute(
+        table.insert(), res.astype(object).where(res.notna(), None).to_dict("records")
+    )
+    session.commit()
+
+
+def load_stats(session, source: str, station_id: int = NO_STATION) -> pandas.DataFrame:
+    table = models.MonthlyStatistic.__table__
+    a = pandas.read_sql_query(
+        sqlalchemy.select(table)
+        .where(table.c.source == source)
+        .where(table.c.station_id == station_id),
+        session.connection(),
+    )
+    a["timestamp"] = (
+        models.series_from_epoch(a["month"]).dt.to_period("M").dt.to_timestamp("M")
+    )
+    return a.pivot(index="timestamp", columns="variable", values=STATISTICS)
+
+
+def to_report_frame(a: pandas.DataFrame) -> pandas.DataFrame:
+    res = pandas.concat(
+        [a["mean"], a["low"].add_suffix("_low"), a["high"].add_suffix("_high")],
+        axis=1,
+    )
+    res.columns.name = None
+    return res
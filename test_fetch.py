@@ -0,0 +1,101 @@
+import asyncio
+import hashlib
+
+import aiohttp
+import sqlalchemy
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from sqlalchemy.orm import sessionmaker
+
+import main
+import models
+
+PAYLOAD = b"Station;Abbr.\nBasel;BAS\n"
+ETAG = '"v1"'
+
+
+async def conditional(request):
+    if request.headers.get("If-None-Match") == ETAG:
+        return web.Response(status=304)
+    return web.Response(body=PAYLOAD, headers={"ETag": ETAG})
+
+
+async def refreshed(request):
+    return web.Response(status=304, headers={"ETag": '"v2"'})
+
+
+async def plain(request):
+    return web.Response(body=PAYLOAD)
+
+
+async def broken(request):
+    return web.Response(status=500)
+
+
+def fetch(path, state=None):
+    async def go():
+        app = web.Application()
+        app.router.add_get("/conditional", conditional)
+        app.router.add_get("/refreshed", refreshed)
+        app.router.add_get("/plain", plain)
+        app.router.add_get("/broken", broken)
+        async with TestServer(app) as server:
+            async with aiohttp.ClientSession() as session:
+                return await main.fetch(str(server.make_url(path)), session, state)
+
+    return asyncio.run(go())
+
+
+def test_fetch_ok():
+    _, status, content, state = fetch("/conditional")
+    assert status == "OK"
+    assert content == PAYLOAD
+    assert state["etag"] == ETAG
+    assert state["content_hash"] == hashlib.sha256(PAYLOAD).hexdigest()
+
+
+def test_fetch_not_modified():
+    _, _, _, state = fetch("/conditional")
+    _, status, content, new_state = fetch("/conditional", state)
+    assert status == "NOT_MODIFIED"
+    assert content is None
+    assert new_state == state
+
+
+def test_fetch_not_modified_refreshes_validators():
+    _, status, _, state = fetch("/refreshed", {"etag": ETAG, "content_hash": "x"})
+    assert status == "NOT_MODIFIED"
+    assert state == {"etag": '"v2"', "last_modified": None, "content_hash": "x"}
+
+
+def test_fetch_unchanged_hash():
+    _, _, _, state = fetch("/plain")
+    _, status, content, _ = fetch("/plain", state)
+    assert status == "UNCHANGED"
+    assert content is None
+
+
+def test_fetch_changed_hash():
+    state = {"content_hash": hashlib.sha256(b"old").hexdigest()}
+    _, status, content, _ = fetch("/plain", state)
+    assert status == "OK"
+    assert content == PAYLOAD
+
+
+def test_fetch_error(monkeypatch):
+    monkeypatch.setattr(main, "BACKOFF_BASE", 0)
+    _, status, _, state = fetch("/broken", {"etag": ETAG})
+    assert status == "ERROR"
+    assert state == {"etag": ETAG}
+
+
+def test_ingest_saves_states_without_new_data():
+    engine = sqlalchemy.create_engine("sqlite://")
+    models.Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    state = {"etag": '"v2"', "last_modified": None, "content_hash": "x"}
+    main.ingest(
+        [("a", "UNCHANGED", None, state), ("b", "NOT_MODIFIED", None, state)],
+        session,
+    )
+    assert main.load_fetch_states(session) == {"a": state, "b": state}